@@ -0,0 +1,50 @@
+"""
+Throughput of the biquad filters, in samples per second.
+
+    python bench/bench_filters.py [seconds]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from mw import dsp, filters
+
+
+def bench(name: str, stage: dsp.Stage, samples: np.ndarray, frame_rate: int):
+    blocks = (samples[i:i + dsp.BLOCK_FRAMES]
+              for i in range(0, len(samples), dsp.BLOCK_FRAMES))
+    start = time.perf_counter()
+    for _ in dsp.run(blocks, [stage]):
+        pass
+    elapsed = time.perf_counter() - start
+
+    rate = samples.size / elapsed
+    print(f"{name:24} {rate / 1e6:8.2f} M samples/s "
+          f"{len(samples) / frame_rate / elapsed:8.1f}x real time")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    frame_rate = 48000
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal((int(seconds * frame_rate), 2)) * 0.1) \
+        .astype(np.float32)
+
+    print(f"{seconds} s of stereo noise at {frame_rate} Hz")
+    bench("hpf 80 Hz, order 2", filters.highpass_filter(frame_rate, 80),
+          samples, frame_rate)
+    bench("hpf 80 Hz, order 8", filters.highpass_filter(frame_rate, 80, 8),
+          samples, frame_rate)
+    bench("lpf 10 kHz, order 4",
+          filters.lowpass_filter(frame_rate, 10000, 4), samples, frame_rate)
+    bench("peq 1 kHz +6 dB", filters.Filter(
+        [filters.peaking(frame_rate, 1000, 6.0, 1.0)]), samples, frame_rate)
+    bench("shelf 8 kHz -6 dB", filters.Filter(
+        [filters.shelf(frame_rate, 8000, -6.0, high=True)]),
+        samples, frame_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Speed of time stretching and pitch shifting, as a multiple of real time.
+
+    python bench/bench_stretch.py [seconds]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from mw import dsp
+from mw.stretch import PitchShift, Stretch
+
+
+def bench(name: str, stage: dsp.Stage, samples: np.ndarray, frame_rate: int):
+    blocks = (samples[i:i + dsp.BLOCK_FRAMES]
+              for i in range(0, len(samples), dsp.BLOCK_FRAMES))
+    start = time.perf_counter()
+    produced = 0
+    for block in dsp.run(blocks, [stage]):
+        produced += len(block)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:24} {len(samples) / frame_rate / elapsed:8.1f}x real time "
+          f"in, {produced / frame_rate / elapsed:8.1f}x out")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    frame_rate = 48000
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal((int(seconds * frame_rate), 2)) * 0.1) \
+        .astype(np.float32)
+
+    print(f"{seconds} s of stereo noise at {frame_rate} Hz")
+    bench("stretch 0.5", Stretch(0.5, frame_rate), samples, frame_rate)
+    bench("stretch 0.9", Stretch(0.9, frame_rate), samples, frame_rate)
+    bench("stretch 1.1", Stretch(1.1, frame_rate), samples, frame_rate)
+    bench("stretch 2", Stretch(2.0, frame_rate), samples, frame_rate)
+    bench("pitch -3", PitchShift(-3, frame_rate), samples, frame_rate)
+    bench("pitch +7", PitchShift(7, frame_rate), samples, frame_rate)
+
+
+if __name__ == "__main__":
+    main()
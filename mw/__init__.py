@@ -6,3 +6,4 @@ __version__ = "0.4.1"
 
 from . import stack
 from . import app
+from . import api
@@ -4,11 +4,12 @@ __main__.py
 """
 
 import optparse
-
-import pydub
+import os
+import sys
 
 from mw import __version__
 from mw.app import App
+from mw.memory import MemoryManager, parse_size
 
 
 def print_banner():
@@ -22,23 +23,54 @@ def main():
                       action="append", metavar="COMMAND")
     parser.add_option("-f", "--file", help="Execute comand file",
                       action="append", metavar="FILE")
+    parser.add_option("--max-memory", help="Spill sounds to disk to keep "
+                      "them under SIZE in memory, e.g. 512M or 2G",
+                      metavar="SIZE")
+    parser.add_option("--serve", help="Run commands sent by clients over "
+                      "a socket", action="store_true", default=False)
+    parser.add_option("--client", help="Send sound files and commands to a "
+                      "server", action="store_true", default=False)
+    parser.add_option("--socket", help="Server socket path", metavar="PATH")
+    parser.add_option("--session", help="Server session name [default]",
+                      default="default", metavar="NAME")
 
     (options, files) = parser.parse_args()
+
+    memory = None
+    if options.max_memory:
+        try:
+            memory = MemoryManager(parse_size(options.max_memory))
+        except ValueError as e:
+            parser.error(str(e))
+
+    if options.serve or options.client:
+        from mw import server
+        path = options.socket or server.default_socket_path()
+
+        if options.serve:
+            server.serve(path, memory)
+        else:
+            script = [f"load \"{os.path.abspath(file)}\"" for file in files]
+            for com_file in options.file or []:
+                with open(com_file, "r") as f:
+                    script += f.readlines()
+            script += options.exec or []
+            sys.stdout.write(server.send(path, script, options.session))
+        return
     
-    app = App()
+    app = App(memory=memory)
     
     print_banner()
 
     for file in files:
         print(f"Reading audio file {file}...")
-        audio = pydub.AudioSegment.from_file(file)
-        app.stack.push_sound(audio)
+        app.load_sound(file)
     
     for com_file in options.file or []:
         print(f"Executing commands in {com_file}...")
         with open(com_file, "r") as f:
             for line in f.readlines():
-                app.handle_command_line(line)
+                app.handle_command_line(line.rstrip("\r\n"))
 
     for command in options.exec or []:
         app.handle_command_line(command)
@@ -0,0 +1,120 @@
+"""
+Finding the lag between two recordings of the same sound.
+
+Lags are found by cross-correlation, computed with FFTs in two passes. The
+coarse pass correlates the whole of both sounds decimated to about
+COARSE_RATE Hz, and the fine pass correlates up to FINE_FRAMES frames of
+their overlap at the full rate, searching only the few frames around the
+coarse lag.
+"""
+
+from typing import Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from mw import dsp
+
+COARSE_RATE = 2000
+COARSE_MAX_FRAMES = 1 << 20
+FINE_FRAMES = 1 << 16
+
+
+def mono(segment: AudioSegment) -> np.ndarray:
+    """
+    The mono mix of a segment as float32, with its DC offset removed.
+    """
+    ints, scale = dsp.decode_ints(segment.raw_data, segment.sample_width)
+    samples = ints.reshape(-1, segment.channels).mean(axis=1,
+                                                      dtype=np.float32)
+    samples /= np.float32(scale)
+    if len(samples) > 0:
+        samples -= samples.mean()
+    return samples
+
+
+def decimate(samples: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Every `factor` samples averaged into one.
+    """
+    whole = len(samples) // factor
+    return samples[:whole * factor].reshape(whole, factor).mean(axis=1)
+
+
+def _fft_size(length: int) -> int:
+    return 1 << max(0, int(length - 1).bit_length())
+
+
+def correlate(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The cross-correlation of `a` and `b` at every lag where they overlap, as
+    (lags, correlation) arrays. At lag k, a[n] is compared with b[n - k].
+    """
+    size = _fft_size(len(a) + len(b) - 1)
+    spectrum = np.fft.rfft(a, size) * np.conj(np.fft.rfft(b, size))
+    full = np.fft.irfft(spectrum, size)
+    lags = np.arange(-(len(b) - 1), len(a))
+    return lags, full[lags % size]
+
+
+def find_lag(reference: AudioSegment,
+             other: AudioSegment) -> Tuple[int, float]:
+    """
+    The number of frames `other` must be delayed by to line up with
+    `reference`, which may be negative, and a confidence between 0 and 1:
+    the normalized correlation of the two at that lag. The lag is in frames
+    of `reference`, and `other` must have the same frame rate.
+    """
+    assert reference.frame_rate == other.frame_rate, \
+        "Sounds must have the same frame rate"
+    a, b = mono(reference), mono(other)
+    assert len(a) > 0 and len(b) > 0, "Can't align an empty sound"
+
+    factor = max(1, reference.frame_rate // COARSE_RATE,
+                 -(-(len(a) + len(b)) // COARSE_MAX_FRAMES))
+    if factor > 1 and min(len(a), len(b)) >= 2 * factor:
+        lags, c = correlate(decimate(a, factor), decimate(b, factor))
+        guess = int(lags[np.argmax(c)]) * factor
+        radius = 2 * factor
+    else:
+        guess, radius = 0, max(len(a), len(b))
+
+    return _refine(a, b, guess, radius)
+
+
+def _refine(a: np.ndarray, b: np.ndarray, guess: int,
+            radius: int) -> Tuple[int, float]:
+    """
+    The best lag within `radius` of `guess`, correlating up to FINE_FRAMES
+    frames from the middle of where `a` and `b` overlap at that lag.
+    """
+    overlap_start = max(0, guess)
+    overlap_end = min(len(a), len(b) + guess)
+    if overlap_end <= overlap_start:
+        overlap_start, overlap_end = 0, len(a)
+    length = min(overlap_end - overlap_start, FINE_FRAMES)
+    start = (overlap_start + overlap_end - length) // 2
+
+    piece = a[start:start + length]
+    # b[start - guess - radius:...], zero-padded where it runs off either end
+    first = start - guess - radius
+    window = np.zeros(length + 2 * radius, dtype=np.float32)
+    lo, hi = max(0, first), min(len(b), first + len(window))
+    if lo < hi:
+        window[lo - first:hi - first] = b[lo:hi]
+
+    # d[j] = sum(piece[n] * window[n + j]), the lag being guess + radius - j
+    size = _fft_size(len(window) + length)
+    d = np.fft.irfft(np.conj(np.fft.rfft(piece, size))
+                     * np.fft.rfft(window, size), size)[:2 * radius + 1]
+
+    energy = np.concatenate(([0.0], np.cumsum(window.astype(np.float64)
+                                              ** 2)))
+    window_energy = energy[length:length + 2 * radius + 1] \
+        - energy[:2 * radius + 1]
+    norm = np.sqrt(np.maximum(window_energy * float(np.dot(piece, piece)),
+                              1e-20))
+
+    j = int(np.argmax(d))
+    confidence = float(np.clip(d[j] / norm[j], 0.0, 1.0))
+    return guess + radius - j, confidence
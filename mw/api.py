@@ -0,0 +1,358 @@
+"""
+A programmatic interface to mw's editing engine.
+
+An Editor holds a Stack and offers the command set as typed methods. It
+does no console input or output and never draws, so it can be embedded in a
+script or a worker process:
+
+    editor = Editor()
+    editor.load("take1.wav")
+    editor.hpf(80)
+    editor.normalize(1.0, start=Milliseconds(500))
+    editor.export("take1_clean.wav")
+
+Selections work as they do at the prompt: methods that take `start` and
+`end` fall back to the top sound's in- and out-points, and then to the
+whole sound.
+
+Streamable operations can be batched with a Pipeline, which renders them
+all in a single pass over the sound, or streams them into a file:
+
+    editor.pipeline().hpf(80).gain(-3.0).resample(44100).apply()
+"""
+
+from typing import Callable, List, Optional, Tuple, cast
+
+import numpy as np
+from pydub import AudioSegment
+
+from mw import dsp, filters
+from mw.markers import Marker
+from mw.stack import Stack, StackFrame
+from mw.stretch import PitchShift, Stretch
+from mw.types import Decibels, Milliseconds
+
+StageFactory = Callable[[int, int], dsp.Stage]
+
+
+class Pipeline:
+    """
+    A chain of streamable operations built up by chained calls and rendered
+    together. Operations that change the sample rate or channel count can
+    only be applied to whole sounds.
+    """
+
+    def __init__(self, editor: 'Editor'):
+        self._editor = editor
+        self._factories: List[StageFactory] = []
+
+    def _add(self, factory: StageFactory) -> 'Pipeline':
+        self._factories.append(factory)
+        return self
+
+    def gain(self, level: Decibels) -> 'Pipeline':
+        return self._add(lambda rate, channels:
+                         dsp.Gain(10.0 ** (level / 20.0)))
+
+    def invert(self) -> 'Pipeline':
+        return self._add(lambda rate, channels: dsp.Gain(-1.0))
+
+    def hpf(self, frequency: float, order: int = 2) -> 'Pipeline':
+        return self._add(lambda rate, channels:
+                         filters.highpass_filter(rate, frequency, order))
+
+    def lpf(self, frequency: float, order: int = 2) -> 'Pipeline':
+        return self._add(lambda rate, channels:
+                         filters.lowpass_filter(rate, frequency, order))
+
+    def shelf(self, frequency: float, level: Decibels,
+              high: bool = False) -> 'Pipeline':
+        return self._add(lambda rate, channels: filters.Filter(
+            [filters.shelf(rate, frequency, level, high)]))
+
+    def peq(self, frequency: float, level: Decibels,
+            q: float = 1.0) -> 'Pipeline':
+        return self._add(lambda rate, channels: filters.Filter(
+            [filters.peaking(rate, frequency, level, q)]))
+
+    def stretch(self, ratio: float) -> 'Pipeline':
+        return self._add(lambda rate, channels: Stretch(ratio, rate))
+
+    def pitch(self, semitones: float) -> 'Pipeline':
+        return self._add(lambda rate, channels: PitchShift(semitones, rate))
+
+    def resample(self, frame_rate: int) -> 'Pipeline':
+        return self._add(lambda rate, channels:
+                         dsp.Resampler(rate, frame_rate))
+
+    def channels(self, count: int) -> 'Pipeline':
+        return self._add(lambda rate, channels:
+                         dsp.ChannelMapper(channels, count))
+
+    def stages(self, frame_rate: int, channels: int) -> List[dsp.Stage]:
+        """
+        Fresh stages for a sound of the given format. Stages hold state, so
+        each render needs its own.
+        """
+        retval = []
+        for factory in self._factories:
+            stage = factory(frame_rate, channels)
+            frame_rate, channels = stage.output_format(frame_rate, channels)
+            retval.append(stage)
+        return retval
+
+    def render(self) -> AudioSegment:
+        """
+        The top sound run through the pipeline, leaving the stack as it is.
+        """
+        segment = self._editor.top.segment
+        return dsp.render(segment, self.stages(segment.frame_rate,
+                                               segment.channels))
+
+    def apply(self, start: Optional[Milliseconds] = None,
+              end: Optional[Milliseconds] = None) -> StackFrame:
+        """
+        Run the top sound, or the selection, through the pipeline in place.
+        """
+        frame = self._editor.top
+        segment = frame.segment
+        stages = self.stages(segment.frame_rate, segment.channels)
+
+        if dsp.output_format(segment, stages) == (segment.frame_rate,
+                                                  segment.channels):
+            frame.process_region_stages(*self._editor._region(start, end),
+                                        stages)
+        else:
+            assert start is None and end is None, \
+                "Format changes can only be applied to the whole sound"
+            frame.segment = dsp.render(segment, stages)
+            frame.view_start = Milliseconds(0)
+            frame.view_end = Milliseconds(len(frame.segment))
+
+        return frame
+
+    def export(self, filename: str) -> str:
+        """
+        Stream the top sound through the pipeline into a wav file, leaving
+        the stack as it is.
+        """
+        frame = self._editor.top
+        frame.export(filename, self.stages(frame.segment.frame_rate,
+                                           frame.segment.channels))
+        return filename
+
+
+class Editor:
+    """
+    A stack of sounds and the operations mw can perform on them.
+    """
+    stack: Stack
+
+    def __init__(self, stack: Optional[Stack] = None):
+        self.stack = stack or Stack([])
+
+    @property
+    def top(self) -> StackFrame:
+        """
+        The frame at the top of the stack. Raises IndexError if the stack is
+        empty.
+        """
+        if self.stack.top is None:
+            raise IndexError("No sound on stack")
+        return self.stack.top
+
+    def _region(self, start: Optional[Milliseconds],
+                end: Optional[Milliseconds]) -> Tuple[Milliseconds,
+                                                      Milliseconds]:
+        frame = self.top
+        length = Milliseconds(len(frame.segment))
+        if start is None:
+            start = frame.in_point or Milliseconds(0)
+        if end is None:
+            end = frame.out_point if frame.out_point is not None else length
+        start = Milliseconds(max(0, min(start, length)))
+        end = Milliseconds(max(0, min(end, length)))
+        return (start, end) if start <= end else (end, start)
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    # Stack
+
+    def load(self, filename: str) -> StackFrame:
+        """
+        Read an audio file and push it onto the stack.
+        """
+        return self.push(AudioSegment.from_file(filename))
+
+    def push(self, segment: AudioSegment) -> StackFrame:
+        self.stack.push_sound(segment)
+        return self.top
+
+    def new(self, length: Milliseconds) -> StackFrame:
+        self.stack.create_new(length)
+        return self.top
+
+    def pop(self) -> AudioSegment:
+        return self.stack.pop().segment
+
+    def dup(self) -> StackFrame:
+        self.stack.dup()
+        return self.top
+
+    def swap(self):
+        self.stack.swap()
+
+    def roll(self, count: int = 1):
+        self.stack.roll(count)
+
+    def split(self, at: Optional[Milliseconds] = None):
+        self.stack.split(at if at is not None else self._region(None, None)[0])
+
+    def append(self) -> StackFrame:
+        self.stack.append()
+        return self.top
+
+    def prepend(self) -> StackFrame:
+        self.stack.prepend()
+        return self.top
+
+    def bounce(self) -> StackFrame:
+        self.stack.bounce()
+        return self.top
+
+    def loop(self, count: int = 2) -> StackFrame:
+        self.stack.loop(count)
+        return self.top
+
+    def align(self, count: int = 1) -> List[Tuple[float, float]]:
+        """
+        Line up the top `count` sounds with the sound beneath them. Returns
+        the offset applied to each, top first, in seconds, and the
+        confidence of the match.
+        """
+        return self.stack.align(count)
+
+    # Selection
+
+    def select(self, start: Optional[Milliseconds],
+               end: Optional[Milliseconds]):
+        """
+        Set the top sound's in- and out-points. None clears a point.
+        """
+        self.top.in_point = start
+        self.top.out_point = end
+
+    def length(self) -> Milliseconds:
+        return Milliseconds(len(self.top.segment))
+
+    # Analysis
+
+    def spectrum(self, start: Optional[Milliseconds] = None,
+                 end: Optional[Milliseconds] = None
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The average spectrum of the selection as (frequencies, dB) arrays.
+        """
+        return self.top.spectrum(*self._region(start, end))
+
+    # Editing
+
+    def crop(self, start: Optional[Milliseconds] = None,
+             end: Optional[Milliseconds] = None):
+        self.top.crop(*self._region(start, end))
+
+    def silence(self, start: Optional[Milliseconds] = None,
+                end: Optional[Milliseconds] = None):
+        start, end = self._region(start, end)
+        self.top.insert_silence(Milliseconds(end - start), start)
+
+    def bloop(self, start: Optional[Milliseconds] = None,
+              end: Optional[Milliseconds] = None):
+        start, end = self._region(start, end)
+        self.top.bloop(Milliseconds(end - start), start)
+
+    def gain(self, level: Decibels, start: Optional[Milliseconds] = None,
+             end: Optional[Milliseconds] = None):
+        self.top.gain(*self._region(start, end), level)
+
+    def normalize(self, level: Decibels = Decibels(0.0),
+                  start: Optional[Milliseconds] = None,
+                  end: Optional[Milliseconds] = None):
+        self.top.normalize(*self._region(start, end), level)
+
+    def fade_in(self, to: Milliseconds,
+                start: Milliseconds = Milliseconds(0)):
+        self.top.fade_in(to, start)
+
+    def fade_out(self, at: Milliseconds, end: Optional[Milliseconds] = None):
+        self.top.fade_out(at, end)
+
+    def reverse(self, start: Optional[Milliseconds] = None,
+                end: Optional[Milliseconds] = None):
+        self.top.reverse(*self._region(start, end))
+
+    def invert(self, start: Optional[Milliseconds] = None,
+               end: Optional[Milliseconds] = None):
+        self.top.invert(*self._region(start, end))
+
+    def hpf(self, frequency: float, order: int = 2,
+            start: Optional[Milliseconds] = None,
+            end: Optional[Milliseconds] = None):
+        self.pipeline().hpf(frequency, order).apply(start, end)
+
+    def lpf(self, frequency: float, order: int = 2,
+            start: Optional[Milliseconds] = None,
+            end: Optional[Milliseconds] = None):
+        self.pipeline().lpf(frequency, order).apply(start, end)
+
+    def shelf(self, frequency: float, level: Decibels, high: bool = False,
+              start: Optional[Milliseconds] = None,
+              end: Optional[Milliseconds] = None):
+        self.pipeline().shelf(frequency, level, high).apply(start, end)
+
+    def peq(self, frequency: float, level: Decibels, q: float = 1.0,
+            start: Optional[Milliseconds] = None,
+            end: Optional[Milliseconds] = None):
+        self.pipeline().peq(frequency, level, q).apply(start, end)
+
+    def stretch(self, ratio: float, start: Optional[Milliseconds] = None,
+                end: Optional[Milliseconds] = None):
+        self.top.stretch(*self._region(start, end), ratio)
+
+    def pitch(self, semitones: float, start: Optional[Milliseconds] = None,
+              end: Optional[Milliseconds] = None):
+        self.top.pitch(*self._region(start, end), semitones)
+
+    def resample(self, frame_rate: int):
+        self.top.resample(frame_rate)
+
+    def channels(self, count: int):
+        self.top.set_channels(count)
+
+    # Markers
+
+    def mark(self, name: str, start: Milliseconds,
+             end: Optional[Milliseconds] = None) -> Marker:
+        """
+        Mark a position on the top sound, or a region if `end` is given.
+        """
+        self.top.mark(name, start, end)
+        return cast(Marker, self.top.markers.get(name))
+
+    def markers(self) -> List[Marker]:
+        return list(self.top.markers)
+
+    # Output
+
+    def export(self, filename: str) -> str:
+        self.top.export(filename)
+        return filename
+
+    def export_regions(self, pattern: str = "{name}.wav",
+                       workers: Optional[int] = None) -> List[str]:
+        """
+        Write each region of the top sound to a wav file named by `pattern`,
+        and return the file names.
+        """
+        return self.top.export_regions(pattern, workers)
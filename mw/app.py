@@ -1,3 +1,4 @@
+from mw.memory import MemoryManager
 from mw.stack import Stack
 from mw.display import Display
 from mw.commands import CommandHandler
@@ -5,7 +6,9 @@ from mw.commands import CommandHandler
 from os.path import join, split
 
 from mw.types import Milliseconds
-from typing import Optional
+from typing import Callable, Optional
+
+from pydub import AudioSegment
 
 try:
     import gnureadline as readline
@@ -18,17 +21,29 @@ class App:
     stack: Stack
     command_handler: CommandHandler
     should_exit: bool
+    read_audio: Callable[[str], AudioSegment]
 
-    def __init__(self):
-        self.stack = Stack([])
+    def __init__(self, read_audio: Callable[[str], AudioSegment] = 
+                 AudioSegment.from_file, 
+                 memory: Optional[MemoryManager] = None):
+        self.stack = Stack([], memory=memory)
         self.display = Display()
         self.command_handler = CommandHandler()
         self.should_exit = False
-        completer = self.command_handler._partial_completion_handler()
-        readline.set_completer(completer)
-        readline.parse_and_bind("tab: complete")
+        self.read_audio = read_audio
+
+    def load_sound(self, filename: str):
+        """
+        Read an audio file and push it onto the stack.
+        """
+        audio = self.read_audio(filename)
+        print(f"Pushing audio ({len(audio)} ms) onto stack...")
+        self.stack.push_sound(audio)
 
     def get_input(self):
+        if self.command_handler._recording is not None:
+            return input("... ")
+
         selection = []
 
         if self.stack.top:
@@ -48,7 +63,7 @@ class App:
 
     def normalize_command_time(self, addr: int) -> Optional[Milliseconds]:
         if self.stack.top is not None:
-            sound_length = Milliseconds(len(self.stack.top.segment) )
+            sound_length = self.stack.top.length()
             if 0 <= addr <= sound_length:
                 return Milliseconds(addr)
             elif addr > sound_length:
@@ -62,6 +77,9 @@ class App:
 
     def run(self):
         # print("Type \"q\" to quit.")
+        completer = self.command_handler._partial_completion_handler()
+        readline.set_completer(completer)
+        readline.parse_and_bind("tab: complete")
         while not self.should_exit:
             command = self.get_input()
             self.handle_command_line(command)
@@ -1,23 +1,28 @@
 import inspect
-from copy import deepcopy
-from typing import List, Callable, Optional
+from functools import partial
+from string import Template
+from typing import Dict, List, Callable, Optional, Tuple, Union
 
 import mw
+from mw import dsp, filters
 from mw.types import Decibels, Milliseconds
 
 from parsimonious.exceptions import IncompleteParseError
+from pydub.exceptions import CouldntDecodeError
 from parsimonious.grammar import Grammar
 from parsimonious import NodeVisitor
 
 
 command_grammar = Grammar(
     r"""
-    command = number? ("," number)? (sep? action arglist)? (sep* "#" comment)? 
+    command = address? ("," address)? (sep? action arglist)? (sep* "#" comment)? 
+    address = number / param
     arglist = (sep argument)*
     argument = (quoted / word)
     quoted = quote literal quote
     action = ~r"[A-z]+[A-z0-9\-]*"
     number = ~r"-?[\d]+"
+    param = ~r"\$[A-Za-z_][A-Za-z0-9_]*"
     word = ~r"[^\s#]+"
     quote = "\""
     comment = ~r".*"
@@ -53,9 +58,15 @@ class CommandParser(NodeVisitor):
 
         return retval
 
+    def visit_address(self, _, visited_children):
+        return visited_children[0]
+
     def visit_number(self, node, _) -> int:
         return int(node.text)
 
+    def visit_param(self, node, _) -> str:
+        return node.text
+
     def visit_action(self, node, _) -> str:
         return node.text
 
@@ -70,6 +81,11 @@ class CommandParser(NodeVisitor):
         return visited_children or node
 
 
+Address = Union[int, Template, None]
+Step = Tuple[Address, Address, Optional[Callable], 
+             List[Union[str, Template]]]
+
+
 def parse_numeric(base_value: int, val: str):
     """
     A helper function for converting numeric entries from the command prompt.
@@ -81,6 +97,55 @@ def parse_numeric(base_value: int, val: str):
     return base_value
 
 
+class Macro:
+    """
+    A named list of commands, parsed and resolved to bound methods when it is 
+    defined. Addresses and arguments that use parameters are kept as 
+    templates and filled in each time the macro is played.
+    """
+    name: str
+    params: List[str]
+    lines: List[str]
+    steps: List[Step]
+
+    def __init__(self, name: str, params: List[str], lines: List[str], 
+                 steps: List[Step]):
+        self.name = name
+        self.params = params
+        self.lines = lines
+        self.steps = steps
+
+
+def _template(text: str, params: List[str]) -> Union[str, Template]:
+    if "$" not in text:
+        return text
+
+    template = Template(text)
+    for match in template.pattern.finditer(text):
+        if match.group("invalid") is not None:
+            raise ValueError(f"{text} has a bad parameter reference")
+        identifier = match.group("named") or match.group("braced")
+        if identifier is not None and identifier not in params:
+            raise ValueError(f"${identifier} is not a parameter")
+    return template
+
+
+def _fill(value: Union[str, Template], values: Dict[str, str]) -> str:
+    if isinstance(value, Template):
+        return value.substitute(values)
+    return value
+
+
+def _fill_address(value: Address, values: Dict[str, str]) -> Optional[int]:
+    if isinstance(value, Template):
+        text = value.substitute(values)
+        try:
+            return int(text)
+        except ValueError:
+            raise ValueError(f"{text} is not a time") from None
+    return value
+
+
 class CommandHandler:
     """
     The command handler implements commands originating from the prompt. The 
@@ -95,38 +160,83 @@ class CommandHandler:
 
     The help() method iterates through all the "normal" named attributes on the 
     class and prints the docstring for each as the help text.
+
+    Command lines between "def NAME [params...]" and "end" are compiled into a 
+    Macro, which is then called like any other command with its parameters 
+    and an optional repeat count.
     """
     _effective_in: Optional[Milliseconds]
     _effective_out: Optional[Milliseconds]
+    _commands: Dict[str, Callable]
+    _names: List[str]
+    _macros: Dict[str, Macro]
+    _recording: Optional[Tuple[str, List[str], List[str]]]
 
     def __init__(self):
         self._parser_grammar = command_grammar
         self._parser_visitor = CommandParser()
-    
+        self._commands = {name: getattr(self, name) for name in dir(self) 
+                          if not name.startswith("_")}
+        self._names = sorted(self._commands)
+        self._macros = {}
+        self._recording = None
+
+    def _parse(self, command: str) -> Dict:
+        return self._parser_visitor.visit(self._parser_grammar.parse(command))
+
     def _handle_command(self, app: 'mw.app.App', command: str): 
-        
+        if self._recording is not None:
+            self._record(command)
+            return
+
         try: 
-            command_dict = self._parser_visitor.visit(
-                self._parser_grammar.parse(command)
-            )
+            command_dict = self._parse(command)
         except IncompleteParseError as e:
             print(f"Error: Command could not be parsed.")
             return
 
+        action = command_dict.get('action')
+        if action == 'def':
+            self._begin_macro(command_dict.get('arguments', []))
+            return
+        elif action == 'end':
+            print("Error: end without def")
+            return
+
+        in_addr = command_dict.get('in_addr')
+        out_addr = command_dict.get('out_addr')
+        if isinstance(in_addr, str) or isinstance(out_addr, str):
+            print("Error: Parameters can only be used in macros.")
+            return
+
+        self._select(app, in_addr, out_addr)
+
+        if action is not None:
+            if action in self._commands:
+                args = command_dict.get('arguments', [])
+                self._commands[action](app, *args)
+            else:
+                print(f"Error: action {action} " 
+                      f"is not recognized.")
+
+    def _select(self, app: 'mw.app.App', in_addr: Optional[int], 
+                out_addr: Optional[int]):
         self._effective_in = None
         self._effective_out = None        
         
         if app.stack.top is not None:
             self._effective_in = app.normalize_command_time(
-                command_dict.get('in_addr', app.stack.top.in_point or 0))
+                in_addr if in_addr is not None 
+                else app.stack.top.in_point or 0)
 
             self._effective_out = app.normalize_command_time(
-                command_dict.get('out_addr', app.stack.top.out_point or -1))
+                out_addr if out_addr is not None 
+                else app.stack.top.out_point or -1)
             
-            if 'in_addr' in command_dict:
+            if in_addr is not None:
                 app.stack.top.in_point = self._effective_in
 
-            if 'out_addr' in command_dict:
+            if out_addr is not None:
                 app.stack.top.out_point = self._effective_out
 
             if self._effective_in is not None \
@@ -135,28 +245,103 @@ class CommandHandler:
                 self._effective_in, self._effective_out = \
                 self._effective_out, self._effective_in
 
-        if 'action' in command_dict.keys():
-            if command_dict['action'] in self._available_commands():
+    def _begin_macro(self, arguments: List[str]):
+        if len(arguments) == 0:
+            print("Error: def needs a macro name.")
+        elif arguments[0] in self._commands \
+                and arguments[0] not in self._macros:
+            print(f"Error: {arguments[0]} is already a command.")
+        else:
+            self._recording = (arguments[0], arguments[1:], [])
 
-                # try:
-                args = command_dict.get('arguments', [])
-                getattr(self, command_dict['action'])(app, *args)
-                # except TypeError:
-                #     print(f"Error: action {command_dict['action']} called 
-                #     with incorrect argument list.")
-            else:
-                print(f"Error: action {command_dict['action']} " 
-                      f"is not recognized.")
+    def _record(self, command: str):
+        assert self._recording is not None
+        name, params, lines = self._recording
+
+        try:
+            command_dict = self._parse(command)
+        except IncompleteParseError:
+            command_dict = {}
+
+        if command_dict.get('action') != 'end':
+            lines.append(command)
+            return
+
+        self._recording = None
+        try:
+            macro = self._compile(name, params, lines)
+        except (IncompleteParseError, ValueError) as e:
+            print(f"Error: macro {name} not defined: {e}")
+            return
+
+        self._macros[name] = macro
+        self._commands[name] = partial(self._play, macro)
+        self._names = sorted(self._commands)
+
+    def _compile(self, name: str, params: List[str], 
+                 lines: List[str]) -> Macro:
+        steps = []
+        for line in lines:
+            command_dict = self._parse(line)
+            action = command_dict.get('action')
+            if action is not None and action not in self._commands:
+                raise ValueError(f"action {action} is not recognized")
+
+            in_addr, out_addr = (
+                _template(a, params) if isinstance(a, str) else a 
+                for a in (command_dict.get('in_addr'), 
+                          command_dict.get('out_addr')))
+            steps.append((
+                in_addr, out_addr,
+                self._commands[action] if action is not None else None,
+                [_template(a, params) 
+                 for a in command_dict.get('arguments', [])]))
+
+        return Macro(name, params, lines, steps)
+
+    def _play(self, macro: Macro, app: 'mw.app.App', *args: str):
+        if len(args) not in (len(macro.params), len(macro.params) + 1):
+            print(f"Error: {macro.name} takes " 
+                  f"[{','.join(macro.params + ['count'])}]")
+            return
 
+        values = dict(zip(macro.params, args))
+        count = 1
+        if len(args) > len(macro.params):
+            count = int(args[-1]) if args[-1].isdigit() else 0
+            if count < 1:
+                print(f"Error: {macro.name}: repeat count {args[-1]} "
+                      f"is not a positive number")
+                return
+
+        try:
+            steps = [(_fill_address(in_addr, values), 
+                      _fill_address(out_addr, values), command, 
+                      [_fill(a, values) for a in arguments])
+                     for in_addr, out_addr, command, arguments in macro.steps]
+        except ValueError as e:
+            print(f"Error: {macro.name}: {e}")
+            return
+
+        with app.display.hold():
+            for _ in range(count):
+                for in_addr, out_addr, command, arguments in steps:
+                    self._select(app, in_addr, out_addr)
+                    if command is not None:
+                        command(app, *arguments)
 
     def _available_commands(self) -> List[str]:
-        return [f for f in dir(self) if not f.startswith("_")]
+        return self._names
 
     def _partial_completion_handler(self) -> Callable[[str, int],Optional[str]]:
+        possible: List[str] = []
+
         def _impl_autocomplete(partial: str, state: int) -> Optional[str]:
-            possible = [name for name in self._available_commands() \
-                if name.startswith(partial)]
-            if len(possible) > 0:
+            nonlocal possible
+            if state == 0:
+                possible = [name for name in self._available_commands() \
+                    if name.startswith(partial)]
+            if state < len(possible):
                 return possible[state]
             else:
                 return None
@@ -170,7 +355,12 @@ class CommandHandler:
     def help(self, _ : 'mw.app.App'):
         "Print help"
         for f in self._available_commands(): 
-            m = getattr(self, f)
+            if f in self._macros:
+                pnames = "[" + ",".join(self._macros[f].params + ["count"]) \
+                    + "]"
+                print(f"{f} {pnames}".ljust(15) + ": Macro")
+                continue
+            m = self._commands[f]
             argspec = inspect.signature(m)
             if len(argspec.parameters) == 1:
                 print(f"{f:15}: {m.__doc__}")
@@ -183,10 +373,22 @@ class CommandHandler:
     #     "Print the license"
     #     print(app.license())
  
+    def macros(self, _ : 'mw.app.App'):
+        "List macros"
+        for macro in self._macros.values():
+            print(" ".join(["def", macro.name] + macro.params))
+            for line in macro.lines:
+                print(f"  {line}")
+            print("end")
+
     def stack(self, app: 'mw.app.App'):
         "Print the stack"
         app.display.print_stack(app.stack)
 
+    def mem(self, app: 'mw.app.App'):
+        "Print the memory used by each sound on the stack"
+        app.display.print_memory(app.stack)
+
     def show(self, app: 'mw.app.App'):
         "Show the current sound"
         app.display.print_head(app.stack)
@@ -209,34 +411,64 @@ class CommandHandler:
         app.display.display_width = int(width)
         app.display.print_head(app.stack)
     
+    def view(self, app: 'mw.app.App'):
+        "Set the view to the selection"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            selected = app.stack.top.in_point is not None \
+                or app.stack.top.out_point is not None
+            if selected and self._effective_in < self._effective_out:
+                app.stack.top.set_view(self._effective_in, self._effective_out)
+            else:
+                app.stack.top.set_view(Milliseconds(0), app.stack.top.length())
+
+        app.display.print_head(app.stack)
+
+    def spectrum(self, app: 'mw.app.App', height = "8"):
+        "Print the average spectrum of the selection, [height] lines tall"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            if self._effective_in < self._effective_out:
+                frequencies, levels = app.stack.top.spectrum(
+                    self._effective_in, self._effective_out)
+                app.display.print_spectrum(frequencies, levels, int(height))
+
+    def spectrogram(self, app: 'mw.app.App', height = "12", style = "shade"):
+        "Print a spectrogram of the view, [height] lines tall, [style] shade or color"
+        if app.stack.top:
+            frame = app.stack.top
+            frequencies, columns = frame.spectrogram(
+                frame.view_start, frame.view_end, 
+                app.display.max_waveform_width())
+            app.display.print_ruler(frame)
+            app.display.print_spectrogram(frequencies, columns, int(height),
+                                          color=(style == "color"))
+
     def dup(self, app: 'mw.app.App'):
         "Push a copy of the current sound onto the stack"
         if app.stack.top:
-            sound = deepcopy(app.stack.top.segment)
-            app.stack.push_sound(sound)
+            app.stack.dup()
             app.display.print_stack(app.stack)
     
     def swap(self, app:'mw.app.App'):
         "Swap the top two sounds on the stack"
         if len(app.stack.entries) > 1:
-            app.stack.entries[-1], app.stack.entries[-2] = \
-                app.stack.entries[-2], app.stack.entries[-1]
+            app.stack.swap()
         
         app.display.print_stack(app.stack)
 
     def pop(self, app:'mw.app.App'):
         "Pop the top sound on the stack, deleting it"
-        app.stack.entries.pop()
+        if app.stack.top:
+            app.stack.pop()
         app.display.print_stack(app.stack)
     
     def roll(self, app:'mw.app.App', count: str = "1"):
         "Roll the stack"
         if count.isdigit() or count[0] == "-" and count[1:].isdigit():
-            num = int(count)
-            num = num % len(app.stack.entries)
-            for _ in range(num):
-                app.stack.entries = app.stack.entries[-1:] + \
-                    app.stack.entries[0:-1]
+            app.stack.roll(int(count))
         else:
             print(f"Parse error: \"{count}\" is not a number")
 
@@ -260,6 +492,15 @@ class CommandHandler:
         
         app.display.print_head(app.stack)
 
+    def load(self, app:'mw.app.App', filename: str):
+        "Read audio file [filename] onto the stack"
+        try:
+            app.load_sound(filename)
+        except (OSError, CouldntDecodeError) as e:
+            print(f"Error: could not read {filename}: {e}")
+            return
+        app.display.print_stack(app.stack)
+
     def new(self, app:'mw.app.App', length = "1000"):
         "Creates a new sound of [length] milliseconds"
         app.stack.create_new(length=Milliseconds(int(length)))
@@ -290,7 +531,7 @@ class CommandHandler:
         app.display.print_head(app.stack)
     
     def normalize(self, app:'mw.app.App', level = "0.0"):
-        "Normalize sound to [level] dB"
+        "Normalize sound to [level] dB below full scale"
         if app.stack.top:
             assert self._effective_in is not None
             assert self._effective_out is not None
@@ -302,22 +543,150 @@ class CommandHandler:
         app.display.print_head(app.stack)
 
 
+    def gain(self, app:'mw.app.App', level = "0.0"):
+        "Change the level of the selection by [level] dB"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+
+            app.stack.top.gain(self._effective_in, 
+                               self._effective_out, 
+                               Decibels(float(level)))
+
+        app.display.print_head(app.stack)
+
+    def reverse(self, app:'mw.app.App'):
+        "Reverse the selection"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            app.stack.top.reverse(self._effective_in, self._effective_out)
+
+        app.display.print_head(app.stack)
+
+    def invert(self, app:'mw.app.App'):
+        "Invert the polarity of the selection"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            app.stack.top.invert(self._effective_in, self._effective_out)
+
+        app.display.print_head(app.stack)
+
+    def _filter_selection(self, app: 'mw.app.App', stage: dsp.Stage):
+        assert app.stack.top is not None
+        assert self._effective_in is not None
+        assert self._effective_out is not None
+        app.stack.top.process_region_stages(self._effective_in, 
+                                            self._effective_out, [stage])
+
+    def hpf(self, app:'mw.app.App', frequency = "80", order = "2"):
+        "High-pass filter the selection at [frequency] Hz, [order] poles"
+        if app.stack.top:
+            rate = app.stack.top.segment.frame_rate
+            self._filter_selection(app, filters.highpass_filter(
+                rate, float(frequency), int(order)))
+
+        app.display.print_head(app.stack)
+
+    def lpf(self, app:'mw.app.App', frequency = "10000", order = "2"):
+        "Low-pass filter the selection at [frequency] Hz, [order] poles"
+        if app.stack.top:
+            rate = app.stack.top.segment.frame_rate
+            self._filter_selection(app, filters.lowpass_filter(
+                rate, float(frequency), int(order)))
+
+        app.display.print_head(app.stack)
+
+    def shelf(self, app:'mw.app.App', frequency = "100", level = "0.0", 
+              kind = "low"):
+        "Shelve the selection [level] dB below (low) or above (high) [frequency] Hz"
+        if app.stack.top:
+            if kind not in ["low", "high"]:
+                print("Parse error: shelf must be \"low\" or \"high\"")
+                return
+            rate = app.stack.top.segment.frame_rate
+            self._filter_selection(app, filters.Filter([filters.shelf(
+                rate, float(frequency), float(level), kind == "high")]))
+
+        app.display.print_head(app.stack)
+
+    def peq(self, app:'mw.app.App', frequency = "1000", level = "0.0", 
+            q = "1.0"):
+        "Boost or cut the selection [level] dB at [frequency] Hz with width [q]"
+        if app.stack.top:
+            rate = app.stack.top.segment.frame_rate
+            self._filter_selection(app, filters.Filter([filters.peaking(
+                rate, float(frequency), float(level), float(q))]))
+
+        app.display.print_head(app.stack)
+
     def fadein(self, app:'mw.app.App'):
-        "Fade in from cilp start to in point"
+        "Fade in across the selection, or from clip start to in point"
         if app.stack.top:
             assert self._effective_in is not None
-            app.stack.top.fade_in(self._effective_in)
+            assert self._effective_out is not None
+            if app.stack.top.out_point is not None:
+                app.stack.top.fade_in(self._effective_out, 
+                                      self._effective_in)
+            else:
+                app.stack.top.fade_in(self._effective_in)
 
         app.display.print_head(app.stack)
 
     def fadeout(self, app:'mw.app.App'):
-        "Fade out from out point to end of file"
+        "Fade out across the selection, or from out point to end of file"
         if app.stack.top:
+            assert self._effective_in is not None
             assert self._effective_out is not None 
-            app.stack.top.fade_out(self._effective_out)
+            if app.stack.top.in_point is not None:
+                app.stack.top.fade_out(self._effective_in, 
+                                       self._effective_out)
+            else:
+                app.stack.top.fade_out(self._effective_out)
         
         app.display.print_head(app.stack)
 
+    def stretch(self, app:'mw.app.App', ratio = "1.0"):
+        "Make the selection [ratio] times as long, keeping its pitch"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            app.stack.top.stretch(self._effective_in, self._effective_out, 
+                                  float(ratio))
+
+        app.display.print_head(app.stack)
+
+    def pitch(self, app:'mw.app.App', semitones = "0"):
+        "Shift the pitch of the selection by [semitones], keeping its length"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            app.stack.top.pitch(self._effective_in, self._effective_out, 
+                                float(semitones))
+
+        app.display.print_head(app.stack)
+
+    def resample(self, app:'mw.app.App', rate = "48000"):
+        "Resample sound to [rate] Hz"
+        if app.stack.top:
+            app.stack.top.resample(int(rate))
+
+        app.display.print_head(app.stack)
+
+    def channels(self, app:'mw.app.App', count = "2"):
+        "Convert sound to [count] channels"
+        if app.stack.top:
+            current = app.stack.top.segment.channels
+            if not count.isdigit() \
+                    or not dsp.can_map_channels(current, int(count)):
+                print(f"Error: can't convert {current} channels to {count}; "
+                      f"only to or from mono")
+                return
+            app.stack.top.set_channels(int(count))
+
+        app.display.print_head(app.stack)
+
     def play(self, app:'mw.app.App'):
         "Play the sound"
         if app.stack.top:
@@ -335,6 +704,16 @@ class CommandHandler:
 
         app.display.print_stack(app.stack)
 
+    def align(self, app: 'mw.app.App', count = "1"):
+        "Line up the top [count] sounds with the sound beneath them"
+        if len(app.stack.entries) > int(count):
+            for i, (offset, confidence) in \
+                    enumerate(app.stack.align(int(count))):
+                print(f"{i:02} moved {offset * 1000:+.1f} ms "
+                      f"(confidence {confidence:.2f})")
+
+        app.display.print_stack(app.stack)
+
     def bloop(self, app: 'mw.app.App'):
         "Replace audio in selection with silence"
         if app.stack.top:
@@ -353,3 +732,68 @@ class CommandHandler:
         if app.stack.top:
             app.stack.top.export(name)
 
+    def mark(self, app: 'mw.app.App', name = ""):
+        "Mark the in point, or the selection as a region, as [name]"
+        if app.stack.top:
+            assert self._effective_in is not None
+            assert self._effective_out is not None
+            frame = app.stack.top
+            is_region = frame.out_point is not None \
+                and self._effective_in < self._effective_out
+            if not name:
+                prefix = "r" if is_region else "m"
+                count = len(frame.markers) + 1
+                while f"{prefix}{count}" in frame.markers:
+                    count += 1
+                name = f"{prefix}{count}"
+
+            if is_region:
+                frame.mark(name, self._effective_in, self._effective_out)
+            else:
+                frame.mark(name, self._effective_in)
+            app.display.print_markers(frame)
+
+    def unmark(self, app: 'mw.app.App', name: str):
+        "Remove marker [name]"
+        if app.stack.top:
+            if name in app.stack.top.markers:
+                app.stack.top.markers.remove(name)
+            else:
+                print(f"Error: no marker named {name}")
+
+    def regions(self, app: 'mw.app.App'):
+        "List the markers and regions of the current sound"
+        if app.stack.top:
+            app.display.print_markers(app.stack.top)
+
+    def exportregions(self, app: 'mw.app.App', pattern = "{name}.wav"):
+        "Export every region as a wav file named by [pattern]"
+        if app.stack.top:
+            try:
+                filenames = app.stack.top.export_regions(pattern)
+            except (KeyError, IndexError, ValueError) as e:
+                print(f"Error: bad file name pattern {pattern}: {e}")
+                return
+            except OSError as e:
+                print(f"Error: could not write regions: {e}")
+                return
+            print(f"Wrote {len(filenames)} regions")
+
+    def savemarks(self, app: 'mw.app.App', filename: str):
+        "Save markers to [filename], a cue sheet if it ends in .cue or else CSV"
+        if app.stack.top:
+            try:
+                app.stack.top.save_markers(filename)
+            except OSError as e:
+                print(f"Error: could not write {filename}: {e}")
+
+    def loadmarks(self, app: 'mw.app.App', filename: str):
+        "Add markers from [filename], a cue sheet if it ends in .cue or else CSV"
+        if app.stack.top:
+            try:
+                app.stack.top.load_markers(filename)
+            except (OSError, KeyError, ValueError, AssertionError) as e:
+                print(f"Error: could not read {filename}: {e!r}")
+                return
+            app.display.print_markers(app.stack.top)
+
@@ -1,21 +1,49 @@
-from typing import Optional
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
 
 import mw
+from mw.memory import format_size, resident_bytes
 from mw.types import Milliseconds
 
-from pydub import AudioSegment
-from apeek import WaveformData, unicode_waveform
+import numpy as np
+from apeek import unicode_waveform
 
 class Display:
     # view_start: Milliseconds
     # view_end:  Milliseconds
     display_width: int
+    _holds: int
+    _held: Optional[Tuple[Callable, tuple]]
 
     def __init__(self):
         self.display_width = 80
+        self._holds = 0
+        self._held = None
         # self.view_start = Milliseconds(0)
         # self.view_end = Milliseconds(1)
 
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """
+        Hold back redraws of the stack and the top sound until the block 
+        ends, then draw only the last one asked for.
+        """
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            if self._holds == 0 and self._held is not None:
+                draw, args = self._held
+                self._held = None
+                draw(*args)
+
+    def _holding(self, draw: Callable, *args) -> bool:
+        if self._holds > 0:
+            self._held = (draw, args)
+            return True
+        return False
+
     def max_waveform_width(self) -> int:
         return self.display_width - 5
     
@@ -25,25 +53,39 @@ class Display:
     def print_width_for_length(self, length: Milliseconds, view_length: Milliseconds) -> int:
         return int(self.max_waveform_width() * length / view_length )
 
-    def create_sized_text_waveform(self, clip: AudioSegment, height: int, view_length: Optional[Milliseconds] = None) -> str:
-        clip_view_length = Milliseconds(len(clip))
+    def create_sized_text_waveform(self, frame: 'mw.stack.StackFrame', 
+                                   start: Milliseconds, end: Milliseconds, 
+                                   height: int, 
+                                   view_length: Optional[Milliseconds] = None) -> str:
+        clip_view_length = Milliseconds(end - start)
         if view_length is None:
             view_length = clip_view_length
         
         bins = self.print_width_for_length(clip_view_length, view_length)
 
-        waveform = WaveformData.create_waveform_data(clip, time_bin_count=bins)
-        return unicode_waveform(waveform.value_pairs, height=height)
+        # Normalized, square-root scaled, as apeek draws them by default
+        pairs = frame.peaks(start, end, bins)
+        scale = np.max(np.abs(pairs), initial=0.0)
+        if scale != 0:
+            pairs = pairs / scale
+        pairs = np.sign(pairs) * np.sqrt(np.fabs(pairs))
+
+        return unicode_waveform(pairs, height=height)
 
     def print_frame(self, index, frame: 'mw.stack.StackFrame', session_length: Milliseconds):
-        waveform_txt = self.create_sized_text_waveform(frame.clip(), height=2, view_length=session_length)
+        waveform_txt = self.create_sized_text_waveform(
+            frame, Milliseconds(0), frame.length(), 
+            height=2, view_length=session_length)
         print(waveform_txt.ljust(self.max_waveform_width()) + f" {index:02}")
 
     def print_frame_single(self, frame: 'mw.stack.StackFrame'):
-        waveform_txt = self.create_sized_text_waveform(frame.clip_for_view(), height=6)
+        waveform_txt = self.create_sized_text_waveform(
+            frame, frame.view_start, frame.view_end, height=6)
         print(waveform_txt)
 
     def print_stack(self, stack: 'mw.stack.Stack'):
+        if self._holding(self.print_stack, stack):
+            return
         if len(stack.entries) > 0:
             session_length = stack.length()
             for i, frame in enumerate(reversed(stack.entries)):
@@ -53,6 +95,8 @@ class Display:
             print("Stack empty")
 
     def print_head(self, stack: 'mw.stack.Stack'):
+        if self._holding(self.print_head, stack):
+            return
         if stack.top:
             self.print_ruler(stack.top)
             self.print_frame_single(stack.top)
@@ -60,6 +104,36 @@ class Display:
         else:
             print("Stack empty")
     
+    def print_memory(self, stack: 'mw.stack.Stack'):
+        if len(stack.entries) == 0:
+            print("Stack empty")
+            return
+
+        for i, frame in enumerate(reversed(stack.entries)):
+            state = "spilled" if frame.is_spilled() else "resident"
+            print(f"{i:02} {format_size(frame.size()):>8} {state}")
+
+        resident = resident_bytes(stack.entries)
+        line = f"Total {format_size(resident)} in memory"
+        if stack.memory is not None:
+            line += f", budget {format_size(stack.memory.budget)}"
+        print(line)
+
+    def print_markers(self, frame: 'mw.stack.StackFrame'):
+        if len(frame.markers) == 0:
+            print("No markers")
+            return
+
+        rate = frame.frame_rate()
+        for marker in frame.markers:
+            start = 1000.0 * marker.start / rate
+            if marker.end is not None:
+                end = 1000.0 * marker.end / rate
+                print(f"{marker.name:15} {start:10.1f} {end:10.1f} ms "
+                      f"({end - start:.1f} ms)")
+            else:
+                print(f"{marker.name:15} {start:10.1f} ms")
+
     def print_ruler(self, entry: 'mw.stack.StackFrame'):
         start_time = f"{entry.view_start}"
         end_time = f"{entry.view_end} ms"
@@ -74,13 +148,19 @@ class Display:
         slug = list(" " * self.display_width)
         in_pos = None
         out_pos = None
-        view_length = Milliseconds(len(entry.clip_for_view()))
+        view_length = entry.view_length()
+
+        def position(point: Milliseconds) -> int:
+            pos = self.print_width_for_length(
+                Milliseconds(point - entry.view_start), view_length)
+            return max(0, min(pos, len(slug) - 1))
+
         if entry.in_point is not None:
-            in_pos = self.print_width_for_length(entry.in_point, view_length) 
+            in_pos = position(entry.in_point)
             slug[in_pos] = "["
 
         if entry.out_point is not None:
-            out_pos = self.print_width_for_length(entry.out_point, view_length)
+            out_pos = position(entry.out_point)
             slug[out_pos] = "]"
 
         if in_pos is not None and out_pos is not None:
@@ -90,6 +170,84 @@ class Display:
         # slug[self.print_width_for_length(entry.cursor, view_length)] = "⬆"
         print("".join(slug))
 
+    def print_spectrum(self, frequencies: np.ndarray, levels: np.ndarray,
+                       height: int = 8, floor: float = -96.0):
+        """
+        Print a bargraph of a spectrum in log-spaced bands from 20 Hz to the 
+        top frequency, one band per column.
+        """
+        bands = self._log_bands(frequencies, self.max_waveform_width())
+        values = np.array([levels[a:b].max() for a, b in bands])
+        chars = " ▁▂▃▄▅▆▇█"
+        steps = np.clip((values - floor) / -floor, 0.0, 1.0) \
+            * height * (len(chars) - 1)
+
+        for row in reversed(range(height)):
+            fill = np.clip(steps - row * (len(chars) - 1), 0, len(chars) - 1)
+            line = "".join(chars[int(f)] for f in fill)
+            label = f"{floor * (height - 1 - row) / height:.0f}" \
+                if (height - 1 - row) % 2 == 0 else ""
+            print(line + f" {label}")
+
+        low = self._frequency_label(frequencies[bands[0][0]])
+        high = self._frequency_label(frequencies[bands[-1][1] - 1])
+        print(low + high.rjust(len(bands) - len(low)) + " Hz")
+
+        peak = int(np.argmax(levels[1:])) + 1
+        print(f"Peak {frequencies[peak]:.0f} Hz at {levels[peak]:.1f} dB")
+
+    def print_spectrogram(self, frequencies: np.ndarray, columns: np.ndarray,
+                          height: int = 12, color: bool = False, 
+                          dynamic_range: float = 80.0):
+        """
+        Print a spectrogram, time running left to right and log frequency 
+        running up, scaled so the loudest point in view is the brightest.
+        """
+        bands = self._log_bands(frequencies, height)
+        rows = np.stack([columns[:, a:b].max(axis=1) for a, b in bands])
+        top = rows.max()
+        levels = np.clip((rows - (top - dynamic_range)) / dynamic_range, 
+                         0.0, 1.0)
+
+        ramp = [16, 17, 18, 19, 54, 90, 126, 162, 198, 203, 209, 215, 
+                221, 227, 229, 231]
+        shades = " ░▒▓█"
+
+        def color_cell(v: float) -> str:
+            return f"\x1b[48;5;{ramp[int(v * (len(ramp) - 1))]}m \x1b[0m"
+
+        def shade_cell(v: float) -> str:
+            return shades[int(v * (len(shades) - 1))]
+
+        cell = color_cell if color else shade_cell
+        for (a, _), row in reversed(list(zip(bands, levels))):
+            label = self._frequency_label(frequencies[a])
+            print("".join(cell(v) for v in row) + f" {label}")
+
+    @staticmethod
+    def _log_bands(frequencies: np.ndarray, count: int):
+        """
+        Split spectrum bins into at most `count` log-spaced bands from 20 Hz 
+        up, as (first, last) bin index pairs.
+        """
+        low = max(20.0, frequencies[1])
+        edges = np.geomspace(low, frequencies[-1], count + 1)
+        index = np.searchsorted(frequencies, edges)
+        bands = []
+        for a, b in zip(index[:-1], index[1:]):
+            b = max(b, a + 1)
+            if bands and a < bands[-1][1]:
+                continue
+            bands.append((int(a), int(min(b, len(frequencies)))))
+        return bands
+
+    @staticmethod
+    def _frequency_label(frequency: float) -> str:
+        if frequency >= 1000:
+            return f"{frequency / 1000:.3g}k"
+        else:
+            return f"{frequency:.0f}"
+
     def show_view_info(self):
         print(f"Display width: {self.display_width} cols")
         # print(f"View start: {self.view_start} ms")
@@ -0,0 +1,394 @@
+"""
+Block-based sample processing.
+
+Sounds are handled here as float32 numpy arrays of shape (frames, channels),
+scaled to [-1.0, 1.0). Long sounds are read and processed in blocks of at
+most BLOCK_FRAMES frames, so the working memory of a processing pass is
+bounded by the block size and not by the length of the sound.
+"""
+
+import wave
+from math import ceil, gcd
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.playback import play
+
+BLOCK_FRAMES = 8192
+
+_SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def full_scale(sample_width: int) -> float:
+    """
+    The magnitude of the most negative code value for a sample width.
+    """
+    return float(2 ** (sample_width * 8 - 1))
+
+
+def decode_ints(data: bytes, sample_width: int) -> Tuple[np.ndarray, float]:
+    """
+    View interleaved little-endian PCM as an integer array, along with the
+    full scale value of those integers. 24-bit samples are widened to 32.
+    """
+    if sample_width == 3:
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        wide = np.zeros((len(packed), 4), dtype=np.uint8)
+        wide[:, 1:] = packed
+        return wide.view("<i4").reshape(-1), full_scale(4)
+    else:
+        return (np.frombuffer(data, dtype=_SAMPLE_TYPES[sample_width]),
+                full_scale(sample_width))
+
+
+def decode(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """
+    Convert interleaved little-endian PCM to a float32 (frames, channels)
+    array.
+    """
+    ints, scale = decode_ints(data, sample_width)
+    return (ints.astype(np.float32) / np.float32(scale)).reshape(-1, channels)
+
+
+def encode(samples: np.ndarray, sample_width: int) -> bytes:
+    """
+    Convert a (frames, channels) float array to interleaved PCM, clipping
+    anything outside of full scale.
+    """
+    scale = full_scale(sample_width)
+    ints = np.clip(np.rint(samples * scale), -scale, scale - 1)
+
+    if sample_width == 3:
+        wide = ints.astype("<i4").reshape(-1, 1).view(np.uint8)
+        return wide[:, :3].tobytes()
+    else:
+        return ints.astype(_SAMPLE_TYPES[sample_width]).tobytes()
+
+
+def to_array(segment: AudioSegment) -> np.ndarray:
+    """
+    Decode an entire segment. Prefer iter_blocks() for long sounds.
+    """
+    return decode(segment.raw_data, segment.sample_width, segment.channels)
+
+
+def from_array(samples: np.ndarray, frame_rate: int,
+               sample_width: int) -> AudioSegment:
+    return AudioSegment(data=encode(samples, sample_width),
+                        sample_width=sample_width,
+                        frame_rate=frame_rate,
+                        channels=samples.shape[1])
+
+
+def iter_blocks(segment: AudioSegment, start: int = 0,
+                end: Optional[int] = None,
+                block_frames: int = BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Decode the frames from `start` to `end` of a segment one block at a time.
+    """
+    frame_width = segment.frame_width
+    data = memoryview(segment.raw_data)
+    if end is None:
+        end = len(data) // frame_width
+
+    for pos in range(start, end, block_frames):
+        stop = min(pos + block_frames, end)
+        yield decode(data[pos * frame_width:stop * frame_width],
+                     segment.sample_width, segment.channels)
+
+
+class Stage:
+    """
+    A step in a block processing chain. A stage is fed blocks in order with
+    process() and may carry state (filter memory, resampler history) from one
+    block to the next. Stages that hold samples back return them from flush()
+    once the input is exhausted.
+
+    The base class passes audio through unchanged.
+    """
+
+    def output_format(self, frame_rate: int,
+                      channels: int) -> Tuple[int, int]:
+        """
+        The frame rate and channel count this stage produces, given its
+        input's.
+        """
+        return frame_rate, channels
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return block
+
+    def flush(self) -> Optional[np.ndarray]:
+        return None
+
+
+class Gain(Stage):
+    """
+    Scales samples by a constant factor.
+    """
+    factor: float
+
+    def __init__(self, factor: float):
+        self.factor = factor
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return block * np.float32(self.factor)
+
+
+def run(blocks: Iterable[np.ndarray],
+        stages: Sequence[Stage]) -> Iterator[np.ndarray]:
+    """
+    Push blocks through a chain of stages, flushing each stage in turn once
+    the input is exhausted.
+    """
+    def through(block: np.ndarray, chain: Sequence[Stage]) -> np.ndarray:
+        for stage in chain:
+            block = stage.process(block)
+        return block
+
+    for block in blocks:
+        block = through(block, stages)
+        if len(block) > 0:
+            yield block
+
+    for i, stage in enumerate(stages):
+        tail = stage.flush()
+        if tail is not None:
+            tail = through(tail, stages[i + 1:])
+            if len(tail) > 0:
+                yield tail
+
+
+def output_format(segment: AudioSegment,
+                  stages: Sequence[Stage]) -> Tuple[int, int]:
+    """
+    The frame rate and channel count of a segment after a chain of stages.
+    """
+    frame_rate, channels = segment.frame_rate, segment.channels
+    for stage in stages:
+        frame_rate, channels = stage.output_format(frame_rate, channels)
+    return frame_rate, channels
+
+
+def render(segment: AudioSegment, stages: Sequence[Stage],
+           sample_width: Optional[int] = None,
+           start: int = 0, end: Optional[int] = None) -> AudioSegment:
+    """
+    Run frames `start` to `end` of a segment through a chain of stages and
+    collect the result as a new segment.
+    """
+    frame_rate, channels = output_format(segment, stages)
+    sample_width = sample_width or segment.sample_width
+    chunks = [encode(block, sample_width) for block in
+              run(iter_blocks(segment, start, end), stages)]
+
+    return AudioSegment(data=b"".join(chunks), sample_width=sample_width,
+                        frame_rate=frame_rate, channels=channels)
+
+
+def write_wav(filename: str, blocks: Iterable[np.ndarray], frame_rate: int,
+              channels: int, sample_width: int):
+    """
+    Write blocks to a wav file as they arrive.
+    """
+    with wave.open(filename, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sample_width)
+        f.setframerate(frame_rate)
+        for block in blocks:
+            data = encode(block, sample_width)
+            if sample_width == 1:
+                # 8-bit wav is unsigned
+                data = (np.frombuffer(data, dtype=np.int8).astype(np.int16)
+                        + 128).astype(np.uint8).tobytes()
+            f.writeframesraw(data)
+
+
+def play_blocks(blocks: Iterable[np.ndarray], frame_rate: int,
+                channels: int, sample_width: int):
+    """
+    Play blocks as they arrive through pyaudio. Without pyaudio, the blocks
+    are collected and played with pydub.
+    """
+    try:
+        import pyaudio
+    except ImportError:
+        data = b"".join(encode(block, sample_width) for block in blocks)
+        play(AudioSegment(data=data, sample_width=sample_width,
+                          frame_rate=frame_rate, channels=channels))
+        return
+
+    p = pyaudio.PyAudio()
+    stream = p.open(format=p.get_format_from_width(sample_width),
+                    channels=channels, rate=frame_rate, output=True)
+    try:
+        for block in blocks:
+            stream.write(encode(block, sample_width))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+
+
+def _kaiser_sinc(length: int, cutoff: float, beta: float) -> np.ndarray:
+    """
+    A windowed-sinc lowpass of `length` taps. `cutoff` is in cycles per
+    sample.
+    """
+    t = np.arange(length) - (length - 1) / 2.0
+    return 2.0 * cutoff * np.sinc(2.0 * cutoff * t) * np.kaiser(length, beta)
+
+
+class Resampler(Stage):
+    """
+    A streaming polyphase windowed-sinc sample rate converter.
+
+    The conversion ratio is reduced to up/down and the prototype lowpass is
+    split into `up` phases, so each output frame costs one dot product of
+    `taps` input frames. Only the last `taps` input frames are kept between
+    blocks.
+    """
+    in_rate: int
+    out_rate: int
+
+    def __init__(self, in_rate: int, out_rate: int, half_width: int = 16,
+                 rolloff: float = 0.95, beta: float = 8.6):
+        assert in_rate > 0 and out_rate > 0, "sample rates must be positive"
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+
+        g = gcd(in_rate, out_rate)
+        self._up = out_rate // g
+        self._down = in_rate // g
+
+        self._taps = 2 * half_width * max(1, ceil(self._down / self._up))
+        # An odd length puts the filter's center on a whole sample; the bank
+        # is padded back out to taps * up with a trailing zero.
+        length = self._taps * self._up - 1
+        prototype = np.append(
+            _kaiser_sinc(length, 0.5 * rolloff / max(self._up, self._down),
+                         beta) * self._up, 0.0)
+
+        # bank[p, k] is applied to input frame (i - k) for output phase p
+        self._bank = prototype.reshape(self._taps, self._up).T.astype(
+            np.float32)
+        self._delay = (length - 1) // 2
+
+        self._buffer: Optional[np.ndarray] = None
+        self._offset = -(self._taps - 1)
+        self._next = 0
+        self._consumed = 0
+
+    def output_format(self, frame_rate: int,
+                      channels: int) -> Tuple[int, int]:
+        return self.out_rate, channels
+
+    def _input_index(self, n: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.divmod(n * self._down + self._delay, self._up)
+
+    def _produce(self, stop: int) -> np.ndarray:
+        assert self._buffer is not None
+        outputs: List[np.ndarray] = []
+        k = np.arange(self._taps)
+        for chunk_start in range(self._next, stop, 4096):
+            n = np.arange(chunk_start, min(chunk_start + 4096, stop))
+            i, phase = self._input_index(n)
+            windows = self._buffer[(i - self._offset)[:, None] - k[None, :]]
+            outputs.append(np.einsum("nk,nkc->nc", self._bank[phase],
+                                     windows))
+
+        if stop > self._next:
+            self._next = stop
+        i_next = int(self._input_index(np.array(self._next))[0])
+        drop = max(0, i_next - self._taps + 1 - self._offset)
+        self._buffer = self._buffer[drop:]
+        self._offset += drop
+
+        if outputs:
+            return np.concatenate(outputs).astype(np.float32)
+        else:
+            return np.zeros((0, self._buffer.shape[1]), dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self._buffer is None:
+            self._buffer = np.zeros((self._taps - 1, block.shape[1]),
+                                    dtype=np.float32)
+
+        self._buffer = np.concatenate([self._buffer, block])
+        self._consumed += len(block)
+
+        last = self._offset + len(self._buffer) - 1
+        stop = (last * self._up + self._up - 1 - self._delay) // self._down + 1
+        return self._produce(max(stop, self._next))
+
+    def flush(self) -> Optional[np.ndarray]:
+        if self._buffer is None:
+            return None
+
+        total = ceil(self._consumed * self._up / self._down)
+        padding = np.zeros((self._taps, self._buffer.shape[1]),
+                           dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, padding])
+        return self._produce(max(total, self._next))
+
+
+def can_map_channels(in_channels: int, out_channels: int) -> bool:
+    """
+    Whether ChannelMapper can convert between two channel counts.
+    """
+    return in_channels > 0 and out_channels > 0 and \
+        (in_channels == out_channels or 1 in (in_channels, out_channels))
+
+
+class ChannelMapper(Stage):
+    """
+    Converts between channel counts: mono is copied to every output channel
+    and multichannel audio is averaged down to mono.
+    """
+    in_channels: int
+    out_channels: int
+
+    def __init__(self, in_channels: int, out_channels: int):
+        assert can_map_channels(in_channels, out_channels), \
+            f"Can't convert {in_channels} channels to {out_channels}"
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+
+    def output_format(self, frame_rate: int,
+                      channels: int) -> Tuple[int, int]:
+        return frame_rate, self.out_channels
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.in_channels == self.out_channels:
+            return block
+        elif self.out_channels == 1:
+            return block.mean(axis=1, keepdims=True)
+        else:
+            return np.repeat(block, self.out_channels, axis=1)
+
+
+def conform(segment: AudioSegment, frame_rate: int, channels: int,
+            sample_width: Optional[int] = None) -> AudioSegment:
+    """
+    Convert a segment to the given sample rate, channel count and sample
+    width, returning the segment itself if it already matches.
+    """
+    sample_width = sample_width or segment.sample_width
+    stages: List[Stage] = []
+
+    # Fold channels down before resampling and spread them out after, so the
+    # resampler always runs on the fewest channels.
+    if channels < segment.channels:
+        stages.append(ChannelMapper(segment.channels, channels))
+    if frame_rate != segment.frame_rate:
+        stages.append(Resampler(segment.frame_rate, frame_rate))
+    if channels > segment.channels:
+        stages.append(ChannelMapper(segment.channels, channels))
+
+    if not stages and sample_width == segment.sample_width:
+        return segment
+
+    return render(segment, stages, sample_width=sample_width)
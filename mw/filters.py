@@ -0,0 +1,198 @@
+"""
+Biquad equalization filters.
+
+Filter designs follow Robert Bristow-Johnson's "Audio EQ Cookbook". Each
+biquad is run in its state-space form over sub-blocks of SUB_BLOCK_FRAMES
+frames: the response of every sub-block to its own input is a single matrix
+product, and the state carried into each sub-block is the sum of the earlier
+sub-blocks' contributions, so the only sequential work is between blocks,
+where the filter state is kept.
+"""
+
+from math import cos, pi, sin, sqrt
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mw import dsp
+
+SUB_BLOCK_FRAMES = 64
+
+Coefficients = Tuple[float, float, float, float, float]
+
+
+def lowpass(frame_rate: int, frequency: float, q: float) -> Coefficients:
+    w0, alpha = _omega(frame_rate, frequency, q)
+    c = cos(w0)
+    return _normalize((1 - c) / 2, 1 - c, (1 - c) / 2,
+                      1 + alpha, -2 * c, 1 - alpha)
+
+
+def highpass(frame_rate: int, frequency: float, q: float) -> Coefficients:
+    w0, alpha = _omega(frame_rate, frequency, q)
+    c = cos(w0)
+    return _normalize((1 + c) / 2, -(1 + c), (1 + c) / 2,
+                      1 + alpha, -2 * c, 1 - alpha)
+
+
+def peaking(frame_rate: int, frequency: float, gain: float,
+            q: float) -> Coefficients:
+    w0, alpha = _omega(frame_rate, frequency, q)
+    a = 10.0 ** (gain / 40.0)
+    c = cos(w0)
+    return _normalize(1 + alpha * a, -2 * c, 1 - alpha * a,
+                      1 + alpha / a, -2 * c, 1 - alpha / a)
+
+
+def shelf(frame_rate: int, frequency: float, gain: float,
+          high: bool = False) -> Coefficients:
+    """
+    A shelf with a slope of 1, boosting or cutting by `gain` dB below
+    `frequency`, or above it if `high`.
+    """
+    w0, alpha = _omega(frame_rate, frequency, 1 / sqrt(2))
+    a = 10.0 ** (gain / 40.0)
+    c = cos(w0)
+    k = 2 * sqrt(a) * alpha
+    sign = -1 if high else 1
+
+    return _normalize(a * ((a + 1) - sign * (a - 1) * c + k),
+                      sign * 2 * a * ((a - 1) - sign * (a + 1) * c),
+                      a * ((a + 1) - sign * (a - 1) * c - k),
+                      (a + 1) + sign * (a - 1) * c + k,
+                      -sign * 2 * ((a - 1) + sign * (a + 1) * c),
+                      (a + 1) + sign * (a - 1) * c - k)
+
+
+def butterworth_qs(order: int) -> List[float]:
+    """
+    The Q of each biquad in a Butterworth cascade of even `order`.
+    """
+    assert order > 0 and order % 2 == 0, "Filter order must be even"
+    return [1 / (2 * cos((2 * k - 1) * pi / (2 * order)))
+            for k in range(1, order // 2 + 1)]
+
+
+def _omega(frame_rate: int, frequency: float, q: float) -> Tuple[float, float]:
+    assert 0 < frequency < frame_rate / 2, \
+        f"Filter frequency must be between 0 and {frame_rate / 2} Hz"
+    assert q > 0, "Filter Q must be positive"
+    w0 = 2 * pi * frequency / frame_rate
+    return w0, sin(w0) / (2 * q)
+
+
+def _normalize(b0, b1, b2, a0, a1, a2) -> Coefficients:
+    return b0 / a0, b1 / a0, b2 / a0, a1 / a0, a2 / a0
+
+
+class _Section:
+    """
+    One biquad and the matrices that run it a sub-block at a time.
+    """
+
+    def __init__(self, coefficients: Coefficients, length: int, count: int):
+        b0, b1, b2, a1, a2 = coefficients
+        a = np.array([[-a1, 1.0], [-a2, 0.0]])
+        b = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        c = np.array([1.0, 0.0])
+
+        powers = [np.eye(2)]
+        for _ in range(length):
+            powers.append(powers[-1] @ a)
+
+        # impulse response, and the zero-input response to a unit state
+        h = np.array([b0] + [c @ powers[k - 1] @ b for k in range(1, length)])
+        self.observe = np.array([c @ powers[n] for n in range(length)])
+        self.convolve = np.zeros((length, length))
+        for n in range(length):
+            self.convolve[n, :n + 1] = h[n::-1]
+
+        # state at the end of a sub-block due to each of its input frames
+        self.accumulate = np.stack([powers[length - 1 - m] @ b
+                                    for m in range(length)], axis=1)
+        self.powers = np.stack(powers)
+        self.advance = powers[length]
+
+        # carry[k, :, j, :] takes the state leaving sub-block j to the start
+        # of sub-block k
+        steps = [np.eye(2)]
+        for _ in range(count):
+            steps.append(steps[-1] @ self.advance)
+        self.carry = np.zeros((count, 2, count, 2))
+        for k in range(count):
+            for j in range(k):
+                self.carry[k, :, j, :] = steps[k - 1 - j]
+        self.steps = np.stack(steps[:count])
+
+        self.length = length
+        self.state: Optional[np.ndarray] = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.state is None:
+            self.state = np.zeros((2, block.shape[1]))
+
+        channels = block.shape[1]
+        whole = len(block) // self.length
+        head = block[:whole * self.length].reshape(whole, self.length,
+                                                   channels)
+        out = np.empty_like(block)
+
+        if whole > 0:
+            zero_state = self.convolve @ head
+            leaving = self.accumulate @ head
+            carry = self.carry[:whole, :, :whole, :].reshape(2 * whole,
+                                                             2 * whole)
+            starts = (carry @ leaving.reshape(2 * whole, channels)).reshape(
+                whole, 2, channels) + self.steps[:whole] @ self.state
+            out[:whole * self.length] = (
+                zero_state + self.observe @ starts).reshape(-1, channels)
+            self.state = self.advance @ starts[-1] + leaving[-1]
+
+        rest = block[whole * self.length:]
+        if len(rest) > 0:
+            n = len(rest)
+            out[whole * self.length:] = self.convolve[:n, :n] @ rest \
+                + self.observe[:n] @ self.state
+            self.state = self.powers[n] @ self.state \
+                + self.accumulate[:, self.length - n:] @ rest
+
+        return out
+
+
+class Filter(dsp.Stage):
+    """
+    A cascade of biquads, keeping each section's state between blocks so it
+    can run inside a streaming chain.
+    """
+    sections: List[Coefficients]
+
+    def __init__(self, sections: Sequence[Coefficients]):
+        self.sections = list(sections)
+        count = -(-dsp.BLOCK_FRAMES // SUB_BLOCK_FRAMES)
+        self._sections = [_Section(s, SUB_BLOCK_FRAMES, count)
+                          for s in self.sections]
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        out = []
+        for pos in range(0, len(block), dsp.BLOCK_FRAMES):
+            piece = block[pos:pos + dsp.BLOCK_FRAMES].astype(np.float64)
+            for section in self._sections:
+                piece = section.process(piece)
+            out.append(piece.astype(np.float32))
+
+        if out:
+            return np.concatenate(out)
+        else:
+            return block
+
+
+def highpass_filter(frame_rate: int, frequency: float,
+                    order: int = 2) -> Filter:
+    return Filter([highpass(frame_rate, frequency, q)
+                   for q in butterworth_qs(order)])
+
+
+def lowpass_filter(frame_rate: int, frequency: float,
+                   order: int = 2) -> Filter:
+    return Filter([lowpass(frame_rate, frequency, q)
+                   for q in butterworth_qs(order)])
@@ -0,0 +1,296 @@
+"""
+Named markers and regions on a sound.
+
+Positions are kept in sample frames, in a MarkerIndex sorted by start with
+bisect, so finding the markers in a span of the sound doesn't scan them
+all. Markers can be saved to and read from CSV files, with times in
+seconds, and cue sheets, where each track starts a region that runs to the
+next.
+"""
+
+import csv
+import os
+import re
+import wave
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydub import AudioSegment
+
+from mw import dsp
+
+CUE_FRAMES_PER_SECOND = 75
+
+
+class Marker:
+    """
+    A named position, or a region if it has an end.
+    """
+    name: str
+    start: int
+    end: Optional[int]
+
+    def __init__(self, name: str, start: int, end: Optional[int] = None):
+        assert start >= 0, "Marker must not be before the start of the sound"
+        assert end is None or end > start, "Region end must be > region start"
+        self.name = name
+        self.start = start
+        self.end = end
+
+    @property
+    def is_region(self) -> bool:
+        return self.end is not None
+
+    def _key(self) -> Tuple[int, int, str]:
+        return (self.start, self.end if self.end is not None else self.start,
+                self.name)
+
+    def __repr__(self) -> str:
+        return f"Marker({self.name!r}, {self.start}, {self.end})"
+
+
+class MarkerIndex:
+    """
+    The markers and regions of a sound, with unique names, sorted by start
+    frame.
+    """
+
+    def __init__(self, markers: Optional[List[Marker]] = None):
+        self._keys: List[Tuple[int, int, str]] = []
+        self._markers: List[Marker] = []
+        self._by_name: Dict[str, Marker] = {}
+        for marker in markers or []:
+            self.add(marker)
+
+    def __len__(self) -> int:
+        return len(self._markers)
+
+    def __iter__(self) -> Iterator[Marker]:
+        return iter(list(self._markers))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def get(self, name: str) -> Optional[Marker]:
+        return self._by_name.get(name)
+
+    def add(self, marker: Marker):
+        """
+        Add a marker, replacing any marker with the same name.
+        """
+        if marker.name in self._by_name:
+            self.remove(marker.name)
+        key = marker._key()
+        i = bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._markers.insert(i, marker)
+        self._by_name[marker.name] = marker
+
+    def remove(self, name: str) -> Marker:
+        marker = self._by_name.pop(name)
+        i = bisect_left(self._keys, marker._key())
+        del self._keys[i]
+        del self._markers[i]
+        return marker
+
+    def clear(self):
+        self._keys.clear()
+        self._markers.clear()
+        self._by_name.clear()
+
+    def copy(self) -> 'MarkerIndex':
+        return MarkerIndex([Marker(m.name, m.start, m.end)
+                            for m in self._markers])
+
+    def regions(self) -> List[Marker]:
+        return [m for m in self._markers if m.is_region]
+
+    def starting_in(self, start: int, end: int) -> List[Marker]:
+        """
+        Markers and regions that start at frames `start` to `end`.
+        """
+        first = bisect_left(self._keys, (start,))
+        last = bisect_left(self._keys, (end,))
+        return self._markers[first:last]
+
+    def section(self, start: int, end: int) -> 'MarkerIndex':
+        """
+        The markers in frames `start` to `end`, moved to be relative to
+        `start`, with regions cut down to fit.
+        """
+        retval = MarkerIndex()
+        last = bisect_left(self._keys, (end,))
+        for marker in self._markers[:last]:
+            if marker.end is None:
+                if marker.start >= start:
+                    retval.add(Marker(marker.name, marker.start - start))
+            elif marker.end > start:
+                retval.add(Marker(marker.name, max(marker.start, start) - start,
+                                  min(marker.end, end) - start))
+        return retval
+
+    def shift(self, at: int, change: int):
+        """
+        Move positions at or after frame `at` by `change` frames, for frames
+        inserted at `at` or, if `change` is negative, removed from it.
+        Positions in removed frames move to `at`, and regions left empty are
+        dropped.
+        """
+        def moved(position: int) -> int:
+            if position < at:
+                return position
+            return max(at, position + change)
+
+        markers = list(self._markers)
+        self.clear()
+        for marker in markers:
+            start = moved(marker.start)
+            end = moved(marker.end) if marker.end is not None else None
+            if end is None or end > start:
+                self.add(Marker(marker.name, start, end))
+
+    def scale(self, factor: float):
+        """
+        Scale every position by `factor`, for a change of frame rate.
+        """
+        markers = list(self._markers)
+        self.clear()
+        for marker in markers:
+            start = round(marker.start * factor)
+            end = round(marker.end * factor) if marker.end is not None \
+                else None
+            if end is None or end > start:
+                self.add(Marker(marker.name, start, end))
+
+
+def save_csv(index: MarkerIndex, filename: str, frame_rate: int):
+    """
+    Write markers as rows of name, start and end in seconds. Markers that
+    aren't regions have an empty end.
+    """
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "start", "end"])
+        for marker in index:
+            writer.writerow([
+                marker.name, f"{marker.start / frame_rate:.6f}",
+                f"{marker.end / frame_rate:.6f}"
+                if marker.end is not None else ""])
+
+
+def load_csv(filename: str, frame_rate: int) -> MarkerIndex:
+    retval = MarkerIndex()
+    with open(filename, newline="") as f:
+        for row in csv.DictReader(f):
+            end = row.get("end") or ""
+            retval.add(Marker(
+                row["name"], round(float(row["start"]) * frame_rate),
+                round(float(end) * frame_rate) if end.strip() else None))
+    return retval
+
+
+def _cue_time(frames: int, frame_rate: int) -> str:
+    cue_frames = round(frames * CUE_FRAMES_PER_SECOND / frame_rate)
+    seconds, ff = divmod(cue_frames, CUE_FRAMES_PER_SECOND)
+    mm, ss = divmod(seconds, 60)
+    return f"{mm:02}:{ss:02}:{ff:02}"
+
+
+def save_cue(index: MarkerIndex, filename: str, frame_rate: int,
+             audio_filename: Optional[str] = None):
+    """
+    Write markers as a cue sheet, one track starting at each marker. Cue
+    sheet times are in 75ths of a second, and region ends aren't kept.
+    """
+    if audio_filename is None:
+        audio_filename = os.path.splitext(os.path.basename(filename))[0] \
+            + ".wav"
+
+    with open(filename, "w") as f:
+        f.write(f"FILE \"{audio_filename}\" WAVE\n")
+        for number, marker in enumerate(index, start=1):
+            f.write(f"  TRACK {number:02} AUDIO\n")
+            f.write(f"    TITLE \"{marker.name}\"\n")
+            f.write(f"    INDEX 01 {_cue_time(marker.start, frame_rate)}\n")
+
+
+def load_cue(filename: str, frame_rate: int, frame_count: int) -> MarkerIndex:
+    """
+    Read a cue sheet's tracks as regions, each running to the start of the
+    next track, or to `frame_count` for the last.
+    """
+    tracks: List[Tuple[str, int]] = []
+    title: Optional[str] = None
+    number = 0
+    with open(filename) as f:
+        for line in f:
+            words = line.strip()
+            track = re.match(r"TRACK\s+(\d+)", words)
+            if track:
+                number = int(track.group(1))
+                title = None
+            elif words.startswith("TITLE") and number > 0:
+                title = words[len("TITLE"):].strip().strip("\"")
+            index = re.match(r"INDEX\s+01\s+(\d+):(\d+):(\d+)", words)
+            if index and number > 0:
+                mm, ss, ff = (int(g) for g in index.groups())
+                cue_frames = (mm * 60 + ss) * CUE_FRAMES_PER_SECOND + ff
+                tracks.append((title or f"Track {number:02}",
+                               round(cue_frames * frame_rate
+                                     / CUE_FRAMES_PER_SECOND)))
+
+    retval = MarkerIndex()
+    ends = [start for _, start in tracks[1:]] + [frame_count]
+    for (name, start), end in zip(tracks, ends):
+        if start < min(end, frame_count):
+            retval.add(Marker(name, start, min(end, frame_count)))
+    return retval
+
+
+def region_filenames(regions: List[Marker], pattern: str,
+                     frame_rate: int) -> List[str]:
+    """
+    File names for regions from a str.format() pattern, with the fields
+    `name`, `index` (counting from 1), and `start` and `end` in seconds.
+    """
+    return [pattern.format(name=region.name, index=index,
+                           start=region.start / frame_rate,
+                           end=(region.end or region.start) / frame_rate)
+            for index, region in enumerate(regions, start=1)]
+
+
+def write_regions(segment: AudioSegment, regions: List[Marker],
+                  filenames: List[str], workers: Optional[int] = None):
+    """
+    Write each region of a segment to a wav file, several at a time. The
+    segment's samples are written straight from its buffer, without
+    copying the regions out first. Raises ValueError if two regions would
+    be written to the same file.
+    """
+    assert len(regions) == len(filenames)
+    if len(set(filenames)) != len(filenames):
+        raise ValueError("Region file names must be unique")
+    raw = memoryview(segment.raw_data)
+    frame_width = segment.frame_width
+
+    def write(region: Marker, filename: str):
+        assert region.end is not None
+        end = min(region.end, int(segment.frame_count()))
+        if segment.sample_width == 1:
+            # 8-bit wav is unsigned, so the samples need converting
+            dsp.write_wav(filename,
+                          dsp.iter_blocks(segment, region.start, end),
+                          segment.frame_rate, segment.channels, 1)
+            return
+        with wave.open(filename, "wb") as f:
+            f.setnchannels(segment.channels)
+            f.setsampwidth(segment.sample_width)
+            f.setframerate(segment.frame_rate)
+            f.writeframesraw(raw[region.start * frame_width:
+                                 end * frame_width])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(write, region, filename)
+                       for region, filename in zip(regions, filenames)]:
+            future.result()
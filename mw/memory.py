@@ -0,0 +1,156 @@
+"""
+A memory budget for the stack.
+
+Frames report the buffers of samples they hold in memory, and a buffer
+shared by several frames, as dup leaves it, is counted once. When a
+MemoryManager's frames hold more than its budget, the least recently used
+buffers are spilled to temporary files and read back in when they're next
+used. A buffer is only spilled once no frame in use holds it, since until
+then spilling it frees nothing.
+"""
+
+import mmap
+import re
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional
+from weakref import WeakKeyDictionary, ref
+
+from pydub import AudioSegment
+
+import mw
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(text: str) -> int:
+    """
+    Parse a byte count like "512M" or "2G".
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", text.upper())
+    if match is None:
+        raise ValueError(f"\"{text}\" is not a size")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def resident_bytes(frames: Iterable['mw.stack.StackFrame']) -> int:
+    """
+    The bytes of samples `frames` hold in memory between them, counting each
+    buffer once however many frames share it.
+    """
+    sizes: Dict[int, int] = {}
+    for frame in frames:
+        for segment in frame.buffers():
+            sizes[id(segment.raw_data)] = len(segment.raw_data)
+    return sum(sizes.values())
+
+
+def format_size(size: int) -> str:
+    for unit in ["T", "G", "M", "K"]:
+        if size >= _UNITS[unit]:
+            return f"{size / _UNITS[unit]:.1f}{unit}"
+    return f"{size}B"
+
+
+class SpillFile:
+    """
+    A segment's samples in an anonymous temporary file, mapped read-only.
+    Frames spilled together share one file, and loading it again while an
+    earlier load is still in use returns that same segment rather than
+    another copy.
+    """
+    size: int
+
+    def __init__(self, segment: AudioSegment):
+        self._loaded = ref(segment)
+        self._format = (segment.sample_width, segment.frame_rate,
+                        segment.channels)
+        self._file = tempfile.TemporaryFile(prefix="mw-")
+        self._file.write(segment.raw_data)
+        self._file.flush()
+        self.size = len(segment.raw_data)
+        self._map: Optional[mmap.mmap] = None
+        if self.size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def load(self) -> AudioSegment:
+        segment = self._loaded()
+        if segment is not None:
+            return segment
+
+        sample_width, frame_rate, channels = self._format
+        data = self._map[:] if self._map is not None else b""
+        segment = AudioSegment(data=data, sample_width=sample_width,
+                               frame_rate=frame_rate, channels=channels)
+        self._loaded = ref(segment)
+        return segment
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __del__(self):
+        self.close()
+
+
+class MemoryManager:
+    """
+    Tracks the frames on one or more stacks and spills the least recently
+    used ones to disk whenever they hold more than `budget` bytes between
+    them. The frame in use is never spilled, so a single frame larger than
+    the budget stays in memory while it's being worked on.
+    """
+    budget: int
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.lock = threading.RLock()
+        self._last_used: 'WeakKeyDictionary[mw.stack.StackFrame, int]' = \
+            WeakKeyDictionary()
+        self._clock = 0
+
+    def track(self, frame: 'mw.stack.StackFrame'):
+        frame.memory = self
+        self.touch(frame)
+        self.enforce(keep=frame)
+
+    def touch(self, frame: 'mw.stack.StackFrame'):
+        with self.lock:
+            self._clock += 1
+            self._last_used[frame] = self._clock
+
+    def resident(self) -> int:
+        with self.lock:
+            return resident_bytes(list(self._last_used.keys()))
+
+    def enforce(self, keep: Optional['mw.stack.StackFrame'] = None):
+        """
+        Spill buffers, least recently used first, until the tracked frames
+        fit in the budget. The frames sharing a buffer are spilled together,
+        to one file, and a buffer `keep` holds isn't spilled at all.
+        """
+        with self.lock:
+            frames = list(self._last_used.keys())
+            if resident_bytes(frames) <= self.budget:
+                return
+
+            groups: Dict[int, List['mw.stack.StackFrame']] = {}
+            for frame in frames:
+                buffers = frame.buffers()
+                if buffers:
+                    groups.setdefault(id(buffers[0].raw_data), []) \
+                        .append(frame)
+
+            by_age = sorted(groups.values(), key=lambda group: max(
+                self._last_used.get(frame, 0) for frame in group))
+            for group in by_age:
+                if keep is not None and keep in group:
+                    continue
+                spill: Optional[SpillFile] = None
+                for frame in group:
+                    spill = frame.spill(spill)
+                if resident_bytes(frames) <= self.budget:
+                    break
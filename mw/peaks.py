@@ -0,0 +1,86 @@
+"""
+Cached waveform peaks.
+"""
+
+from typing import Optional
+
+import numpy as np
+from pydub import AudioSegment
+
+from mw import dsp
+
+PEAK_BLOCK_FRAMES = 256
+_SCAN_BLOCKS = 1024
+
+
+class PeakCache:
+    """
+    The maximum and minimum sample value of every PEAK_BLOCK_FRAMES frames of
+    a sound, computed on demand. Edits to part of a sound invalidate only
+    the blocks they touch, so redrawing after a selection edit only rescans
+    the selection.
+    """
+    _max: np.ndarray
+    _min: np.ndarray
+    _valid: np.ndarray
+
+    def __init__(self, frame_count: int = 0):
+        self.reset(frame_count)
+
+    def reset(self, frame_count: int):
+        count = -(-frame_count // PEAK_BLOCK_FRAMES)
+        self._max = np.zeros(count, dtype=np.float32)
+        self._min = np.zeros(count, dtype=np.float32)
+        self._valid = np.zeros(count, dtype=bool)
+
+    def invalidate(self, start: int, end: int):
+        """
+        Forget the blocks overlapping frames `start` to `end`.
+        """
+        first = start // PEAK_BLOCK_FRAMES
+        last = -(-end // PEAK_BLOCK_FRAMES)
+        self._valid[first:last] = False
+
+    def complete(self, first: int, last: int) -> bool:
+        """
+        Whether blocks `first` to `last` are all cached.
+        """
+        return bool(np.all(self._valid[first:last]))
+
+    def blocks(self, segment: Optional[AudioSegment], first: int,
+               last: Optional[int] = None) -> np.ndarray:
+        """
+        The (max, min) pairs of blocks `first` to `last` of `segment` as a
+        (blocks, 2) array, scanning only the blocks that aren't cached. The
+        segment may be omitted if the blocks are complete.
+        """
+        if last is None:
+            last = len(self._valid)
+
+        missing = np.flatnonzero(~self._valid[first:last]) + first
+        if len(missing) > 0:
+            assert segment is not None, "Peaks aren't cached"
+            self._scan(segment, int(missing[0]), int(missing[-1]) + 1)
+
+        return np.stack([self._max[first:last], self._min[first:last]],
+                        axis=1)
+
+    def _scan(self, segment: AudioSegment, first: int, last: int):
+        """
+        Compute blocks `first` to `last` straight from the integer samples,
+        a chunk of blocks at a time.
+        """
+        frame_width = segment.frame_width
+        block_width = PEAK_BLOCK_FRAMES * frame_width
+        data = memoryview(segment.raw_data)
+
+        for lo in range(first, last, _SCAN_BLOCKS):
+            hi = min(lo + _SCAN_BLOCKS, last)
+            ints, scale = dsp.decode_ints(data[lo * block_width:
+                                               hi * block_width],
+                                          segment.sample_width)
+            edges = np.arange(0, len(ints), PEAK_BLOCK_FRAMES
+                              * segment.channels)
+            self._max[lo:hi] = np.maximum.reduceat(ints, edges) / scale
+            self._min[lo:hi] = np.minimum.reduceat(ints, edges) / scale
+            self._valid[lo:hi] = True
@@ -0,0 +1,270 @@
+"""
+A resident mw process that runs command scripts sent over a Unix domain
+socket.
+
+A request is a header line naming a session, followed by command lines,
+ended by the client shutting down its side of the connection:
+
+    session NAME
+    load "take1.wav"
+    hpf 80
+    export out.wav
+
+The server runs the lines against the session's App and sends back
+everything the commands printed. Sessions keep their stack between
+requests, and requests to different sessions run concurrently. Audio files
+are decoded once and shared by every session that loads them.
+"""
+
+import errno
+import io
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from pydub import AudioSegment
+
+from mw.app import App
+from mw.memory import MemoryManager
+
+DEFAULT_SESSION = "default"
+
+_FileKey = Tuple[str, int, int]
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"mw-{os.getuid()}.sock")
+
+
+class AudioCache:
+    """
+    Decoded audio files, keyed by path, size and modification time.
+    AudioSegments are immutable, so one decoded file can be pushed onto any
+    number of stacks. Files are only held while some stack holds them, so
+    the cache never keeps audio alive that a memory budget has spilled or
+    that every session has dropped.
+    """
+
+    def __init__(self):
+        self._files: 'WeakValueDictionary[_FileKey, AudioSegment]' = \
+            WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def read(self, filename: str) -> AudioSegment:
+        path = os.path.abspath(filename)
+        info = os.stat(path)
+        key = (path, info.st_size, info.st_mtime_ns)
+
+        with self._lock:
+            audio = self._files.get(key)
+        if audio is not None:
+            return audio
+
+        audio = AudioSegment.from_file(path)
+
+        with self._lock:
+            self._files[key] = audio
+        return audio
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Stands in for sys.stdout, sending each thread's output to the buffer it
+    has claimed, or to the real stdout if it hasn't claimed one. It's
+    installed while any server is open and the real stdout is put back when
+    the last one closes.
+    """
+    _users = 0
+    _users_lock = threading.Lock()
+
+    @classmethod
+    def install(cls) -> '_ThreadOutput':
+        with cls._users_lock:
+            if not isinstance(sys.stdout, _ThreadOutput):
+                sys.stdout = _ThreadOutput(sys.stdout)
+            cls._users += 1
+            return sys.stdout
+
+    @classmethod
+    def remove(cls):
+        with cls._users_lock:
+            cls._users -= 1
+            if cls._users == 0 and isinstance(sys.stdout, _ThreadOutput):
+                sys.stdout = sys.stdout._stdout
+
+    def __init__(self, stdout):
+        self._stdout = stdout
+        self._local = threading.local()
+
+    def claim(self, buffer: Optional[io.StringIO]):
+        self._local.buffer = buffer
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stdout).write(text)
+
+    def flush(self):
+        buffer = getattr(self._local, "buffer", None)
+        (buffer or self._stdout).flush()
+
+
+class _Session:
+    def __init__(self, app: App):
+        self.app = app
+        self.lock = threading.Lock()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Keeps an App per named session and the decoded audio they share. If a
+    memory manager is given, every session's stack is held to its budget.
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, memory: Optional[MemoryManager] = None):
+        self.memory = memory
+        self.audio_cache = AudioCache()
+        self._sessions: Dict[str, _Session] = {}
+        self._sessions_lock = threading.Lock()
+        _remove_stale_socket(path)
+        self._bound = False
+        self._output: Optional[_ThreadOutput] = _ThreadOutput.install()
+        super().__init__(path, _Handler)
+
+    def server_bind(self):
+        # Clients can run any command, reading and writing files as this
+        # user, so only this user may connect. Nothing can connect before
+        # the socket listens, so there's no window before the chmod.
+        super().server_bind()
+        self._bound = True
+        os.chmod(self.server_address, 0o600)
+
+    def session(self, name: str) -> _Session:
+        with self._sessions_lock:
+            if name not in self._sessions:
+                self._sessions[name] = _Session(
+                    App(read_audio=self.audio_cache.read, memory=self.memory))
+            return self._sessions[name]
+
+    def end_session(self, name: str):
+        with self._sessions_lock:
+            self._sessions.pop(name, None)
+
+    def run_script(self, name: str, lines: Iterable[str]) -> str:
+        """
+        Run command lines in a session and return what they printed.
+        """
+        session = self.session(name)
+        output = io.StringIO()
+        stdout = self._output
+        assert stdout is not None, "Server is closed"
+
+        with session.lock:
+            stdout.claim(output)
+            try:
+                for line in lines:
+                    line = line.rstrip("\r\n")
+                    try:
+                        session.app.handle_command_line(line)
+                    except Exception as e:
+                        print(f"Error: {line}: {e!r}")
+                    if session.app.should_exit:
+                        self.end_session(name)
+                        break
+            finally:
+                stdout.claim(None)
+
+        return output.getvalue()
+
+    def server_close(self):
+        super().server_close()
+        if self._bound and os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+            self._bound = False
+        if self._output is not None:
+            self._output = None
+            _ThreadOutput.remove()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Server
+
+    def handle(self):
+        header = self.rfile.readline().decode("utf-8").split()
+        if not header:
+            # a connection closed unused, such as a check for a live server
+            return
+        if len(header) == 2 and header[0] == "session":
+            name = header[1]
+        else:
+            self.wfile.write(b"Error: expected \"session NAME\"\n")
+            return
+
+        lines = (line.decode("utf-8") for line in self.rfile)
+        self.wfile.write(self.server.run_script(name, lines).encode("utf-8"))
+
+
+def _remove_stale_socket(path: str):
+    """
+    Remove a socket left by a server that has exited. Raises OSError if a
+    server is still listening on `path`, or it isn't a socket.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, f"{path} exists and is not a socket")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise OSError(errno.EADDRINUSE, f"A server is already running on {path}")
+
+
+def serve(path: str, memory: Optional[MemoryManager] = None):
+    try:
+        server = Server(path, memory)
+    except OSError as e:
+        print(f"Error: could not serve on {path}: {e.strerror or e}",
+              file=sys.stderr)
+        sys.exit(1)
+
+    with server:
+        print(f"mw serving on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def send(path: str, script: Iterable[str],
+         session: str = DEFAULT_SESSION) -> str:
+    """
+    Send command lines to a server session and return its output.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        request = f"session {session}\n" + \
+            "".join(line.rstrip("\n") + "\n" for line in script)
+        s.sendall(request.encode("utf-8"))
+        s.shutdown(socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    return b"".join(chunks).decode("utf-8")
@@ -0,0 +1,161 @@
+"""
+Spectrum analysis.
+
+Spectra are measured on a mono mix with FFT_SIZE-frame Hann windows and
+reported as power in dB relative to a full-scale sine.
+"""
+
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from mw import dsp
+
+FFT_SIZE = 2048
+BASE_HOP = 512
+TILE_COLUMNS = 64
+CACHE_TILES = 128
+MAX_SUBWINDOWS = 8
+
+_CHUNK_WINDOWS = 256
+_FLOOR = 1e-12
+
+_hann = np.hanning(FFT_SIZE).astype(np.float32)
+_hann_gain = float(np.sum(_hann) / 2) ** 2
+
+
+def frequencies(frame_rate: int) -> np.ndarray:
+    return np.fft.rfftfreq(FFT_SIZE, 1.0 / frame_rate)
+
+
+def power_spectra(segment: AudioSegment, starts: np.ndarray,
+                  end: int) -> np.ndarray:
+    """
+    The power spectra of the windows starting at each frame in `starts`, as
+    a (windows, FFT_SIZE // 2 + 1) array. Frames at or after `end` are
+    treated as silence.
+    """
+    ints, scale = dsp.decode_ints(segment.raw_data, segment.sample_width)
+    frames = ints.reshape(-1, segment.channels)
+    end = min(end, len(frames))
+
+    retval = np.empty((len(starts), FFT_SIZE // 2 + 1), dtype=np.float32)
+    offsets = np.arange(FFT_SIZE)
+    for pos in range(0, len(starts), _CHUNK_WINDOWS):
+        index = starts[pos:pos + _CHUNK_WINDOWS, None] + offsets[None, :]
+        outside = (index < 0) | (index >= end)
+        windows = frames[np.clip(index, 0, max(end - 1, 0))] \
+            .mean(axis=2, dtype=np.float32) / np.float32(scale)
+        windows[outside] = 0.0
+        spectra = np.fft.rfft(windows * _hann, axis=1)
+        retval[pos:pos + _CHUNK_WINDOWS] = \
+            (spectra.real ** 2 + spectra.imag ** 2) / _hann_gain
+
+    return retval
+
+
+def to_db(power: np.ndarray) -> np.ndarray:
+    return 10.0 * np.log10(np.maximum(power, _FLOOR))
+
+
+def average_spectrum(segment: AudioSegment, start: int,
+                     end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The mean power spectrum of frames `start` to `end` over half-overlapping
+    windows, as (frequencies, dB) arrays.
+    """
+    assert start < end, "Region is empty"
+    starts = np.arange(start, max(start + 1, end - FFT_SIZE + 1),
+                       FFT_SIZE // 2)
+    total = np.zeros(FFT_SIZE // 2 + 1, dtype=np.float64)
+    for pos in range(0, len(starts), _CHUNK_WINDOWS):
+        total += power_spectra(segment, starts[pos:pos + _CHUNK_WINDOWS],
+                               end).sum(axis=0)
+
+    return frequencies(segment.frame_rate), to_db(total / len(starts))
+
+
+class SpectrogramCache:
+    """
+    Spectrogram columns, computed TILE_COLUMNS at a time and kept in an LRU
+    of tiles.
+
+    Columns are spaced `hop` frames apart, where the hop is BASE_HOP doubled
+    until a view needs no more than about twice as many columns as it has
+    display columns, so zooming at one level or scrolling reuses the same
+    tiles. Where the hop is longer than BASE_HOP a column averages up to
+    MAX_SUBWINDOWS windows spread across it.
+    """
+
+    def __init__(self, max_tiles: int = CACHE_TILES):
+        self.max_tiles = max_tiles
+        self._tiles: 'OrderedDict[Tuple[int, int], np.ndarray]' = \
+            OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def clear(self):
+        self._tiles.clear()
+
+    def invalidate(self, start: int, end: int):
+        """
+        Forget tiles whose windows overlap frames `start` to `end`.
+        """
+        for hop, index in list(self._tiles.keys()):
+            span = TILE_COLUMNS * hop
+            if index * span - FFT_SIZE < end \
+                    and start < (index + 1) * span + FFT_SIZE:
+                del self._tiles[(hop, index)]
+
+    @staticmethod
+    def hop_for(frames: int, columns: int) -> int:
+        hop = BASE_HOP
+        while frames > 2 * columns * hop:
+            hop *= 2
+        return hop
+
+    def tile(self, segment: AudioSegment, hop: int,
+             index: int) -> np.ndarray:
+        """
+        Tile `index` at `hop`, as a (TILE_COLUMNS, bins) array of dB.
+        """
+        key = (hop, index)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        subwindows = min(hop // BASE_HOP, MAX_SUBWINDOWS)
+        centers = (index * TILE_COLUMNS + np.arange(TILE_COLUMNS)) * hop
+        spread = (np.arange(subwindows) * hop) // subwindows
+        starts = (centers[:, None] + spread[None, :]).reshape(-1) \
+            - FFT_SIZE // 2
+        power = power_spectra(segment, starts, int(segment.frame_count()))
+        tile = to_db(power.reshape(TILE_COLUMNS, subwindows, -1)
+                     .mean(axis=1))
+
+        self._tiles[key] = tile
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def columns(self, segment: AudioSegment, start: int, end: int,
+                count: int) -> np.ndarray:
+        """
+        `count` spectrogram columns spanning frames `start` to `end`, as a
+        (count, bins) array of dB. Each column is the loudest of the cached
+        columns it covers.
+        """
+        assert start < end and count > 0
+        hop = self.hop_for(end - start, count)
+        first, last = start // hop, max(start // hop + 1, -(-end // hop))
+
+        tiles = [self.tile(segment, hop, i) for i in
+                 range(first // TILE_COLUMNS, (last - 1) // TILE_COLUMNS + 1)]
+        offset = first - (first // TILE_COLUMNS) * TILE_COLUMNS
+        cols = np.concatenate(tiles)[offset:offset + last - first]
+
+        edges = np.linspace(0, len(cols), count, endpoint=False).astype(int)
+        return np.maximum.reduceat(cols, edges, axis=0)
@@ -1,29 +1,294 @@
 # from numpy import who
+import numpy as np
 from pydub import AudioSegment
-from pydub.effects import normalize
 from pydub.playback import play
 
+from contextlib import nullcontext
+
+from mw import dsp, markers
+from mw.align import find_lag
+from mw.markers import Marker, MarkerIndex
+from mw.memory import MemoryManager, SpillFile
+from mw.peaks import PeakCache, PEAK_BLOCK_FRAMES
+from mw.stretch import PitchShift, Stretch, pitch_ratio
+from mw.spectrum import SpectrogramCache, average_spectrum, frequencies
 from mw.types import Decibels, Milliseconds
 
-from typing import List, Optional, cast 
+from typing import (Callable, ContextManager, Dict, List, Optional, Sequence, 
+                    Tuple, cast)
 
 
 class StackFrame: 
-    segment: AudioSegment
+    _segment: Optional[AudioSegment]
+    _spill: Optional[SpillFile]
+    _frame_count: int
+    _frame_rate: int
+    _frame_width: int
+    memory: Optional[MemoryManager]
+    _conformed: Dict[Tuple[int, int, int], AudioSegment]
+    _peaks: PeakCache
+    _spectrogram: SpectrogramCache
     # cursor: Milliseconds
     in_point: Optional[Milliseconds]
     out_point: Optional[Milliseconds]
     view_start: Milliseconds
     view_end: Milliseconds
+    markers: MarkerIndex
 
     def __init__(self, segment: AudioSegment):
+        self.memory = None
         self.segment = segment
+        self.markers = MarkerIndex()
         # self.cursor = Milliseconds(0)
         self.in_point = None
         self.out_point = None
         self.view_start = Milliseconds(0)
         self.view_end = Milliseconds( len(segment) )
 
+    @property
+    def segment(self) -> AudioSegment:
+        """
+        The frame's sound, read back in from disk if it was spilled.
+        """
+        if self.memory is not None:
+            self.memory.touch(self)
+
+        with self._guard():
+            segment = self._segment
+            if segment is None:
+                assert self._spill is not None
+                segment = self._segment = self._spill.load()
+                self._grown()
+
+        return segment
+
+    @segment.setter
+    def segment(self, value: AudioSegment):
+        with self._guard():
+            self._segment = value
+            self._spill = None
+            self._frame_count = int(value.frame_count())
+            self._frame_rate = value.frame_rate
+            self._frame_width = value.frame_width
+            self._conformed = {}
+            self._peaks = PeakCache(self._frame_count)
+            self._spectrogram = SpectrogramCache()
+        self._grown()
+
+    def _guard(self) -> ContextManager:
+        return self.memory.lock if self.memory is not None else nullcontext()
+
+    def _grown(self):
+        if self.memory is not None:
+            self.memory.touch(self)
+            self.memory.enforce(keep=self)
+
+    def length(self) -> Milliseconds:
+        """
+        The length of the sound, without reading it in if it's spilled.
+        """
+        return Milliseconds(round(1000 * self._frame_count / self._frame_rate))
+
+    def frame_rate(self) -> int:
+        """
+        The sound's frame rate, without reading it in if it's spilled.
+        """
+        return self._frame_rate
+
+    def size(self) -> int:
+        """
+        The size of the sound's samples in bytes.
+        """
+        return self._frame_count * self._frame_width
+
+    def buffers(self) -> List[AudioSegment]:
+        """
+        The segments this frame holds in memory, its own first and then any 
+        converted copies, or none if it's spilled.
+        """
+        segment = self._segment
+        if segment is None:
+            return []
+        return [segment] + [c for c in self._conformed.values() 
+                            if c is not segment]
+
+    def is_spilled(self) -> bool:
+        return self._segment is None
+
+    def spill(self, spill: Optional[SpillFile] = None) -> Optional[SpillFile]:
+        """
+        Release the sound's samples, writing them to a temporary file first 
+        unless they are already there, or `spill` already holds them. 
+        Caches that don't hold samples are kept. Returns the file.
+        """
+        with self._guard():
+            if self._segment is None:
+                return self._spill
+            if self._spill is None:
+                self._spill = spill if spill is not None \
+                    else SpillFile(self._segment)
+            self._segment = None
+            self._conformed = {}
+            return self._spill
+
+    def conformed(self, frame_rate: int, channels: int, 
+                  sample_width: int) -> AudioSegment:
+        """
+        The segment converted to the given format. Conversions are cached 
+        until the segment is next replaced, and the copies dup makes of a 
+        frame share its cache, so a sound that is dup'd and mixed in again 
+        and again is only converted once.
+        """
+        key = (frame_rate, channels, sample_width)
+        if key not in self._conformed:
+            converted = dsp.conform(self.segment, frame_rate, channels, 
+                                    sample_width)
+            self._conformed[key] = converted
+            self._grown()
+            return converted
+        return self._conformed[key]
+
+    def frame_at(self, at: Milliseconds) -> int:
+        """
+        The index of the sample frame at a time, clamped to the sound.
+        """
+        frame = int(at * self._frame_rate / 1000.0)
+        return max(0, min(frame, self._frame_count))
+
+    def _replace_frames(self, at: int, data: bytes, 
+                        count: Optional[int] = None):
+        """
+        Replace `count` frames starting at frame `at` with `data`, by default 
+        as many frames as `data` holds. Cached peaks outside of the replaced 
+        frames are kept if the length doesn't change.
+
+        pydub segments are immutable, and a frame's segment may also be held 
+        by the frames dup made of it or by the server's cache of decoded 
+        files, so the splice makes one copy of the whole buffer. Only the 
+        region itself is decoded and encoded.
+        """
+        frame_width = self.segment.frame_width
+        raw = memoryview(self.segment.raw_data)
+        start = at * frame_width
+        end = start + (len(data) if count is None else count * frame_width)
+        assert end <= len(raw), "Replacement runs past end of sound"
+
+        segment = self.segment._spawn(b"".join((raw[:start], data, 
+                                                raw[end:])))
+        if len(data) != end - start:
+            self.segment = segment
+            return
+
+        with self._guard():
+            self._segment = segment
+            self._spill = None
+            self._conformed = {}
+            self._peaks.invalidate(at, end // frame_width)
+            self._spectrogram.invalidate(at, end // frame_width)
+        self._grown()
+
+    def process_region(self, start: Milliseconds, end: Milliseconds, 
+                       process: Callable[[np.ndarray], np.ndarray]):
+        """
+        Replace the samples from `start` to `end` with the result of `process`
+        applied to them. Only the region is decoded and re-encoded. 
+        """
+        a, b = self.frame_at(start), self.frame_at(end)
+        assert a < b, "Region is empty"
+
+        frame_width = self.segment.frame_width
+        samples = dsp.decode(
+            memoryview(self.segment.raw_data)[a * frame_width:b * frame_width],
+            self.segment.sample_width, self.segment.channels)
+        processed = process(samples)
+        assert processed.shape == samples.shape, \
+            "Region processing must not change the length of the region"
+        self._replace_frames(a, dsp.encode(processed, 
+                                           self.segment.sample_width))
+
+    def process_region_stages(self, start: Milliseconds, end: Milliseconds, 
+                              stages: Sequence[dsp.Stage]):
+        """
+        Stream the samples from `start` to `end` through a chain of stages 
+        that preserve format, block by block. If the stages change the 
+        length of the region, the rest of the sound moves to make room, and 
+        selection points after the region move with it.
+        """
+        a, b = self.frame_at(start), self.frame_at(end)
+        assert a < b, "Region is empty"
+
+        length = len(self.segment)
+        sample_width = self.segment.sample_width
+        chunks = [dsp.encode(block, sample_width) for block in 
+                  dsp.run(dsp.iter_blocks(self.segment, a, b), stages)]
+        data = b"".join(chunks)
+        self._replace_frames(a, data, b - a)
+
+        frames = len(data) // self.segment.frame_width - (b - a)
+        if frames != 0:
+            self.markers.shift(b + min(frames, 0), frames)
+
+        change = len(self.segment) - length
+        if change != 0:
+            if self.in_point is not None and self.in_point >= end:
+                self.in_point = Milliseconds(self.in_point + change)
+            if self.out_point is not None and self.out_point >= end:
+                self.out_point = Milliseconds(self.out_point + change)
+            self.view_start = Milliseconds(0)
+            self.view_end = Milliseconds(len(self.segment))
+
+    def peaks(self, start: Milliseconds, end: Milliseconds, 
+              bins: int) -> np.ndarray:
+        """
+        The (max, min) sample values of `bins` equal divisions of the sound 
+        from `start` to `end`, as a (bins, 2) array scaled to full scale.
+        """
+        a, b = self.frame_at(start), self.frame_at(end)
+        if bins < 1 or b - a < bins:
+            return np.zeros((max(bins, 0), 2), dtype=np.float32)
+
+        if (b - a) // bins >= PEAK_BLOCK_FRAMES:
+            first, last = a // PEAK_BLOCK_FRAMES, b // PEAK_BLOCK_FRAMES
+            # a spilled frame can be drawn from its cache without reading it
+            segment = None if self._peaks.complete(first, last) \
+                else self.segment
+            pairs = self._peaks.blocks(segment, first, last)
+            edges = np.linspace(0, last - first, bins, 
+                                endpoint=False).astype(int)
+        else:
+            frame_width = self.segment.frame_width
+            samples = dsp.decode(
+                memoryview(self.segment.raw_data)[a * frame_width:
+                                                  b * frame_width],
+                self.segment.sample_width, self.segment.channels)
+            pairs = np.stack([samples.max(axis=1), samples.min(axis=1)], 
+                             axis=1)
+            edges = np.linspace(0, b - a, bins, endpoint=False).astype(int)
+
+        return np.stack([np.maximum.reduceat(pairs[:, 0], edges),
+                         np.minimum.reduceat(pairs[:, 1], edges)], axis=1)
+
+    def spectrum(self, start: Milliseconds, 
+                 end: Milliseconds) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The average spectrum of the sound from `start` to `end`, as arrays of 
+        frequencies and dB.
+        """
+        return average_spectrum(self.segment, self.frame_at(start), 
+                                self.frame_at(end))
+
+    def spectrogram(self, start: Milliseconds, end: Milliseconds, 
+                    columns: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The spectrogram of the sound from `start` to `end` in `columns` time 
+        steps, as an array of frequencies and a (columns, frequencies) array 
+        of dB. Tiles of the spectrogram are cached, so redrawing a view that 
+        overlaps an earlier one only analyzes the new part.
+        """
+        return (frequencies(self.segment.frame_rate), 
+                self._spectrogram.columns(self.segment, self.frame_at(start), 
+                                          self.frame_at(end), columns))
+
     def view_length(self) -> Milliseconds:
         assert self.view_end > self.view_start
         return Milliseconds( self.view_end - self.view_start )
@@ -31,8 +296,15 @@ class StackFrame:
     def zoom(self, factor: float):
         pass
 
+    def set_view(self, start: Milliseconds, end: Milliseconds):
+        assert start < end, "View end must be > view start"
+        self.view_start = Milliseconds(max(0, start))
+        self.view_end = Milliseconds(min(end, len(self.segment)))
+
     def crop(self, start: Milliseconds, end: Milliseconds):
         assert end > start, "crop end must be > crop start"
+        self.markers = self.markers.section(self.frame_at(start), 
+                                            self.frame_at(end))
         self.segment = cast(AudioSegment, self.segment[start:end])
         self.in_point = None
         self.out_point = None
@@ -45,40 +317,170 @@ class StackFrame:
         a = self.segment[0:at]
         b = self.segment[at:]
         silence = AudioSegment.silent(duration=duration)
+        frame_count = self._frame_count
         self.segment = a + silence + b
+        self.markers.shift(self.frame_at(at), 
+                           self._frame_count - frame_count)
         self.view_start = Milliseconds(0)
         self.view_end = Milliseconds(len(self.segment))
 
+    def offset(self, frames: int):
+        """
+        Move the sound later by `frames` frames, inserting silence at its 
+        start, or earlier if `frames` is negative, trimming its start. The 
+        selection moves with the sound.
+        """
+        if frames == 0:
+            return
+        segment = self.segment
+        raw = segment.raw_data
+        if frames > 0:
+            data = bytes(frames * segment.frame_width) + raw
+        else:
+            data = memoryview(raw)[-frames * segment.frame_width:].tobytes()
+        self.segment = segment._spawn(data)
+        self.markers.shift(0, frames)
+
+        length = len(self.segment)
+        shift = 1000.0 * frames / segment.frame_rate
+        if self.in_point is not None:
+            self.in_point = Milliseconds(
+                max(0, min(round(self.in_point + shift), length)))
+        if self.out_point is not None:
+            self.out_point = Milliseconds(
+                max(0, min(round(self.out_point + shift), length)))
+        self.view_start = Milliseconds(0)
+        self.view_end = Milliseconds(length)
+
     def bloop(self, duration: Milliseconds, at: Milliseconds):
-        assert at + duration < len(self.segment)
-        a = self.segment[0:at]
-        b = self.segment[at + duration:]
-        silence = AudioSegment.silent(duration)
-        self.segment = a + silence + b
+        assert at + duration <= len(self.segment)
+        self.process_region(at, Milliseconds(at + duration), np.zeros_like)
+
+    def gain(self, start: Milliseconds, end: Milliseconds, level: Decibels):
+        factor = 10.0 ** (level / 20.0)
+        self.process_region(start, end, lambda x: x * factor)
 
-        self.view_start = Milliseconds(0)
-        self.view_end = Milliseconds(len(self.segment))
-    
     def normalize(self, start: Milliseconds, end: Milliseconds, level: Decibels):
+        """
+        Scale the region so its peak is `level` dB below full scale, the 
+        headroom pydub's normalize takes.
+        """
         assert 0 <= start < len(self.segment)
-        assert 0 <= end < len(self.segment)
+        assert 0 <= end <= len(self.segment)
         assert start < end
 
-        a = cast(AudioSegment, self.segment[0:start])
-        b = cast(AudioSegment, self.segment[start:end])
-        c = cast(AudioSegment, self.segment[end:])
-        b = normalize(b, level)
-        
-        self.segment = a + b + c
-
-
-    def fade_in(self, to: Milliseconds):
-        assert (0 <= to < len(self.segment))
-        self.segment = self.segment.fade_in(to)
+        def _normalize(samples: np.ndarray) -> np.ndarray:
+            peak = float(np.max(np.abs(samples), initial=0.0))
+            if peak == 0.0:
+                return samples
+            return samples * (10.0 ** (-level / 20.0) / peak)
+
+        self.process_region(start, end, _normalize)
+
+    def fade_in(self, to: Milliseconds, start: Milliseconds = Milliseconds(0)):
+        """
+        Fade linearly in from `start` to `to`. An empty span is left as it 
+        is.
+        """
+        assert (0 <= start <= to <= len(self.segment))
+        if to > start:
+            self.process_region(start, to, lambda x: x * 
+                                np.linspace(0.0, 1.0, len(x))[:, None])
+
+    def fade_out(self, at: Milliseconds, end: Optional[Milliseconds] = None):
+        """
+        Fade linearly out from `at` to `end`, by default the end of the sound.
+        An empty span is left as it is.
+        """
+        if end is None:
+            end = Milliseconds(len(self.segment))
+        assert (0 <= at <= end <= len(self.segment))
+        if end > at:
+            self.process_region(at, end, lambda x: x * 
+                                np.linspace(1.0, 0.0, len(x))[:, None])
+
+    def reverse(self, start: Milliseconds, end: Milliseconds):
+        self.process_region(start, end, lambda x: x[::-1])
+
+    def invert(self, start: Milliseconds, end: Milliseconds):
+        self.process_region(start, end, np.negative)
+
+    def stretch(self, start: Milliseconds, end: Milliseconds, ratio: float):
+        """
+        Make the region `ratio` times as long without changing its pitch.
+        """
+        self.process_region_stages(start, end, [
+            Stretch(ratio, self.segment.frame_rate)])
+
+    def pitch(self, start: Milliseconds, end: Milliseconds, 
+              semitones: float):
+        """
+        Shift the pitch of the region by `semitones` without changing its 
+        length. A shift too small to change the pitch leaves the sound as 
+        it is.
+        """
+        if pitch_ratio(semitones) == 1:
+            return
+        self.process_region_stages(start, end, [
+            PitchShift(semitones, self.segment.frame_rate)])
+
+    def resample(self, frame_rate: int):
+        assert frame_rate > 0, "Sample rate must be positive"
+        self.markers.scale(frame_rate / self.segment.frame_rate)
+        self.segment = dsp.conform(self.segment, frame_rate, 
+                                   self.segment.channels)
+        self.view_start = Milliseconds(0)
+        self.view_end = Milliseconds(len(self.segment))
 
-    def fade_out(self, at: Milliseconds):
-        assert (0 <= at < len(self.segment))
-        self.segment = self.segment.fade_out(len(self.segment) - at)
+    def set_channels(self, channels: int):
+        assert channels > 0, "Channel count must be positive"
+        self.segment = dsp.conform(self.segment, self.segment.frame_rate, 
+                                   channels)
+
+    def mark(self, name: str, start: Milliseconds, 
+             end: Optional[Milliseconds] = None):
+        """
+        Add a marker at `start`, or a region if an `end` is given, replacing 
+        any marker with the same name.
+        """
+        self.markers.add(Marker(name, self.frame_at(start), 
+                                self.frame_at(end) if end is not None 
+                                else None))
+
+    def export_regions(self, pattern: str, 
+                       workers: Optional[int] = None) -> List[str]:
+        """
+        Write every region to a wav file named by `pattern`, a str.format() 
+        pattern with the fields name, index, start and end. Returns the 
+        file names.
+        """
+        regions = self.markers.regions()
+        filenames = markers.region_filenames(regions, pattern, 
+                                             self._frame_rate)
+        markers.write_regions(self.segment, regions, filenames, workers)
+        return filenames
+
+    def save_markers(self, filename: str):
+        """
+        Write the markers to a cue sheet if `filename` ends in .cue, and 
+        otherwise to a CSV file.
+        """
+        if filename.lower().endswith(".cue"):
+            markers.save_cue(self.markers, filename, self._frame_rate)
+        else:
+            markers.save_csv(self.markers, filename, self._frame_rate)
+
+    def load_markers(self, filename: str):
+        """
+        Add the markers in a cue sheet or CSV file.
+        """
+        if filename.lower().endswith(".cue"):
+            loaded = markers.load_cue(filename, self._frame_rate, 
+                                      self._frame_count)
+        else:
+            loaded = markers.load_csv(filename, self._frame_rate)
+        for marker in loaded:
+            self.markers.add(marker)
 
     def clip_for_view(self) -> AudioSegment:
         return cast(AudioSegment, self.segment[self.view_start:self.view_end])
@@ -86,8 +488,13 @@ class StackFrame:
     def clip(self) -> AudioSegment:
         return self.segment
 
-    def play(self):
-        play(self.segment)
+    def play(self, stages: Sequence[dsp.Stage] = ()):
+        if stages:
+            frame_rate, channels = dsp.output_format(self.segment, stages)
+            dsp.play_blocks(dsp.run(dsp.iter_blocks(self.segment), stages), 
+                            frame_rate, channels, self.segment.sample_width)
+        else:
+            play(self.segment)
 
     def pad(self, to_length: Milliseconds):
         to_add = len(self.segment) - to_length
@@ -97,17 +504,35 @@ class StackFrame:
         self.view_start = Milliseconds(0)
         self.view_end = Milliseconds(len(self.segment))
 
-    def export(self, filename):
-        self.segment.export(filename,format='wav')
+    def export(self, filename, stages: Sequence[dsp.Stage] = ()):
+        """
+        Write the sound to a wav file, running it through `stages` on the way 
+        out a block at a time.
+        """
+        if stages:
+            frame_rate, channels = dsp.output_format(self.segment, stages)
+            dsp.write_wav(filename, 
+                          dsp.run(dsp.iter_blocks(self.segment), stages), 
+                          frame_rate, channels, self.segment.sample_width)
+        else:
+            self.segment.export(filename,format='wav')
 
 
 class Stack:
     entries: List[StackFrame]
+    memory: Optional[MemoryManager]
 
-    def __init__(self, segments : List[AudioSegment]):
+    def __init__(self, segments : List[AudioSegment], 
+                 memory: Optional[MemoryManager] = None):
         self.entries = []
+        self.memory = memory
         for segment in segments:
             self.push_sound(segment)
+
+    def _push(self, frame: StackFrame):
+        self.entries.append(frame)
+        if self.memory is not None:
+            self.memory.track(frame)
         
     @property
     def top(self) -> Optional[StackFrame]:
@@ -118,47 +543,103 @@ class Stack:
             return None
 
     def push_sound(self, segment: AudioSegment):
-        print(f"Pushing audio ({len(segment)} ms) onto stack...")
-        self.entries.append(StackFrame(segment=segment))
+        self._push(StackFrame(segment=segment))
+
+    def pop(self) -> StackFrame:
+        assert self.top is not None, "No sound on stack"
+        return self.entries.pop()
+
+    def dup(self):
+        assert self.top is not None, "No sound on stack"
+        # AudioSegments are immutable, so the copy can share the samples
+        source = self.top
+        self.push_sound(source.segment)
+        self.top.markers = source.markers.copy()
+        # the cache is replaced, never changed in place, when either 
+        # frame's segment changes, so sharing it is safe
+        self.top._conformed = source._conformed
+
+    def swap(self):
+        assert len(self.entries) > 1
+        self.entries[-1], self.entries[-2] = self.entries[-2], self.entries[-1]
+
+    def roll(self, count: int = 1):
+        if len(self.entries) > 0:
+            count = count % len(self.entries)
+            self.entries = self.entries[-count:] + self.entries[:-count]
 
     def create_new(self, length: Milliseconds):
-        n = StackFrame(segment=AudioSegment.silent(length, 48000))
-        self.entries.append(n)
+        self._push(StackFrame(segment=AudioSegment.silent(length, 48000)))
+
+    def _conformed_pair(self, a: StackFrame, 
+                        b: StackFrame) -> Tuple[AudioSegment, AudioSegment]:
+        """
+        The segments of two frames converted to a common format, the highest 
+        rate, channel count and sample width of the two.
+        """
+        frame_rate = max(a.segment.frame_rate, b.segment.frame_rate)
+        channels = max(a.segment.channels, b.segment.channels)
+        sample_width = max(a.segment.sample_width, b.segment.sample_width)
+        return (a.conformed(frame_rate, channels, sample_width),
+                b.conformed(frame_rate, channels, sample_width))
+
+    def align(self, count: int = 1) -> List[Tuple[float, float]]:
+        """
+        Line up each of the top `count` sounds with the sound beneath them, 
+        the reference, by moving them earlier or later. Returns the offset 
+        applied to each, top first, in seconds, and the confidence of the 
+        match.
+        """
+        assert count > 0, "Count must be positive"
+        assert len(self.entries) > count, "Not enough sounds on stack"
+
+        reference = self.entries[-count - 1]
+        frame_rate = reference.segment.frame_rate
+        retval = []
+        for frame in reversed(self.entries[-count:]):
+            other = frame.conformed(frame_rate, frame.segment.channels, 
+                                    frame.segment.sample_width)
+            lag, confidence = find_lag(reference.segment, other)
+            seconds = lag / frame_rate
+            frame.offset(round(seconds * frame.segment.frame_rate))
+            retval.append((seconds, confidence))
+        return retval
 
     def split(self, at: Milliseconds):
         assert self.top is not None, "No sound on stack"
         to_split = self.top.segment
         a = cast(AudioSegment, to_split[0:at])
         b = cast(AudioSegment, to_split[at:])
-        self.entries.pop()
-        self.entries.append(StackFrame(a))
-        self.entries.append(StackFrame(b))
+        index = self.entries.pop().markers
+        split_frame = int(a.frame_count())
+        self._push(StackFrame(a))
+        self.top.markers = index.section(0, split_frame)
+        self._push(StackFrame(b))
+        self.top.markers = index.section(split_frame, 
+                                         split_frame + int(b.frame_count()))
 
     def append(self):
         assert len(self.entries) > 1
 
-        a = self.entries.pop().segment
-        b = self.entries.pop().segment
-        self.entries.append(StackFrame(a + b))
+        a, b = self._conformed_pair(self.entries.pop(), self.entries.pop())
+        self._push(StackFrame(a + b))
 
     def prepend(self):
         assert len(self.entries) > 1
 
-        a = self.entries.pop().segment
-        b = self.entries.pop().segment
-        self.entries.append(StackFrame(b + a))
+        a, b = self._conformed_pair(self.entries.pop(), self.entries.pop())
+        self._push(StackFrame(b + a))
 
     def loop(self, count: int = 2):
         assert len(self.entries) > 0
         a = self.entries.pop()
         segment = cast(AudioSegment, a.segment[a.in_point or 0:a.out_point or len(a.segment)])
-        self.entries.append(StackFrame(segment * count))
+        self._push(StackFrame(segment * count))
 
     def bounce(self):
         assert len(self.entries) > 1
         
-        a = self.entries[-1].segment
-        b = self.entries[-2].segment
+        a, b = self._conformed_pair(self.entries[-1], self.entries[-2])
 
         if len(a) < len(b):
             a, b = b, a
@@ -166,10 +647,10 @@ class Stack:
         self.entries.pop()
         self.entries.pop()
 
-        self.entries.append(StackFrame(a.overlay(b)))
+        self._push(StackFrame(a.overlay(b)))
 
 
     def length(self) -> Milliseconds:
-        return Milliseconds(max(list(map(lambda x: len(x.clip()), self.entries)) + [0]))
+        return Milliseconds(max([x.length() for x in self.entries] + [0]))
 
 
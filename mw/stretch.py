@@ -0,0 +1,290 @@
+"""
+Time stretching and pitch shifting.
+
+Stretch is a phase vocoder. Input is analysed in Hann-windowed frames
+`ratio` times closer together than the frames are overlapped back out, and
+each bin's phase is advanced by its measured frequency over the output hop,
+so partials keep their pitch while the sound gets longer or shorter. All the
+frames a block makes available are transformed together, and the phase
+advance across them is a cumulative sum, so the only sequential work is
+between blocks.
+
+PitchShift stretches by the pitch ratio and then resamples back to the
+original length.
+"""
+
+from fractions import Fraction
+from math import ceil, log2
+from typing import Optional, Tuple
+
+import numpy as np
+
+from mw import dsp
+
+MIN_RATIO = 0.125
+MAX_RATIO = 8.0
+
+_CHUNK_FRAMES = 64
+
+
+def fft_size(frame_rate: int) -> int:
+    """
+    The analysis frame length for a frame rate, 2048 frames at 44.1 and
+    48 kHz.
+    """
+    return 1 << max(8, round(log2(frame_rate * 2048 / 48000)))
+
+
+def _nearest_peaks(magnitude: np.ndarray) -> np.ndarray:
+    """
+    For every bin of (frames, bins, channels) spectra, the index of the
+    nearest bin that is louder than the two bins either side of it.
+    """
+    bins = magnitude.shape[1]
+    padded = np.pad(magnitude, ((0, 0), (2, 2), (0, 0)))
+    middle = padded[:, 2:-2]
+    is_peak = (middle > padded[:, :-4]) & (middle > padded[:, 1:-3]) \
+        & (middle >= padded[:, 3:-1]) & (middle >= padded[:, 4:])
+
+    index = np.arange(bins)[None, :, None]
+    below = np.maximum.accumulate(np.where(is_peak, index, -1), axis=1)
+    above = np.minimum.accumulate(np.where(is_peak, index, bins)[:, ::-1],
+                                  axis=1)[:, ::-1]
+    nearest = np.where(above - index < index - below, above, below)
+    nearest = np.where(below < 0, above, nearest)
+    nearest = np.where(above >= bins, below, nearest)
+    return np.where(nearest < 0, index, nearest)
+
+
+def pitch_ratio(semitones: float) -> Fraction:
+    """
+    The frequency ratio for a shift of `semitones`, as a fraction with a
+    denominator of at most 256.
+    """
+    return Fraction(2.0 ** (semitones / 12.0)).limit_denominator(256)
+
+
+class Stretch(dsp.Stage):
+    """
+    A streaming phase vocoder that makes a sound `ratio` times as long
+    without changing its pitch. Only one frame of input and of overlapping
+    output are kept between blocks.
+    """
+    ratio: float
+
+    def __init__(self, ratio: float, frame_rate: int):
+        assert MIN_RATIO <= ratio <= MAX_RATIO, \
+            f"Stretch ratio must be between {MIN_RATIO} and {MAX_RATIO}"
+        self.ratio = ratio
+
+        # Frames overlap at least four times on both sides, so shortening
+        # overlaps the output more.
+        self._hops = 4 << max(0, ceil(log2(1.0 / ratio)))
+        self._size = fft_size(frame_rate)
+        self._hop = self._size // self._hops
+        self._analysis_hop = self._hop / ratio
+        self._window = np.hanning(self._size + 1)[:self._size] \
+            .astype(np.float32)
+        # the overlapped squared windows sum to this everywhere
+        self._gain = float(np.sum(self._window ** 2)) / self._hop
+        self._omega = 2 * np.pi * np.arange(self._size // 2 + 1) / self._size
+
+        # Input is preceded by enough silence that its first frame is
+        # overlapped by a full set of windows, and the output that silence
+        # maps to is dropped.
+        self._lead = ceil((self._size - self._hop) / ratio)
+        self._drop = round(self._lead * ratio)
+
+        self._buffer: Optional[np.ndarray] = None
+        self._buffer_start = 0
+        self._frame = 0
+        self._previous: Optional[Tuple[np.ndarray, int]] = None
+        self._phase: Optional[np.ndarray] = None
+        self._tail: Optional[np.ndarray] = None
+        self._consumed = 0
+        self._produced = 0
+        self._total: Optional[int] = None
+
+    def _position(self, frame: np.ndarray) -> np.ndarray:
+        return np.round(frame * self._analysis_hop).astype(np.int64)
+
+    def _synthesize(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Transform the frames at `positions` and return their windowed
+        output frames, as a (frames, size, channels) array.
+        """
+        assert self._buffer is not None
+        index = (positions - self._buffer_start)[:, None] \
+            + np.arange(self._size)[None, :]
+        frames = self._buffer[index] * self._window[None, :, None]
+        spectra = np.fft.rfft(frames, axis=1)
+        magnitude = np.abs(spectra)
+        phase = np.angle(spectra)
+
+        if self._previous is None:
+            self._previous = (phase[0], int(positions[0]))
+            self._phase = phase[0]
+            advance_first = False
+        else:
+            advance_first = True
+        assert self._phase is not None
+
+        last_phase, last_position = self._previous
+        previous = np.concatenate([last_phase[None], phase[:-1]])
+        steps = np.diff(positions, prepend=last_position).astype(np.float64)
+        expected = self._omega[None, :, None] * steps[:, None, None]
+        deviation = phase - previous - expected
+        deviation -= 2 * np.pi * np.round(deviation / (2 * np.pi))
+        frequency = self._omega[None, :, None] \
+            + deviation / np.maximum(steps, 1.0)[:, None, None]
+        advance = self._hop * frequency
+        if not advance_first:
+            advance[0] = 0.0
+
+        synthesis = self._phase[None] + np.cumsum(advance, axis=0)
+        self._phase = np.mod(synthesis[-1], 2 * np.pi)
+        self._previous = (phase[-1], int(positions[-1]))
+
+        # Bins around a peak keep their phase relative to it, so the peak's
+        # partial stays one coherent sinusoid.
+        peak = _nearest_peaks(magnitude)
+        synthesis = np.take_along_axis(synthesis, peak, axis=1) + phase \
+            - np.take_along_axis(phase, peak, axis=1)
+
+        out = np.fft.irfft(magnitude * np.exp(1j * synthesis),
+                           n=self._size, axis=1)
+        return (out * self._window[None, :, None] / self._gain) \
+            .astype(np.float32)
+
+    def _overlap(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Overlap-add output frames onto the held tail and return the output
+        that no later frame will overlap.
+        """
+        count, _, channels = frames.shape
+        hops = frames.reshape(count, self._hops, self._hop, channels)
+        out = np.zeros((count + self._hops - 1, self._hop, channels),
+                       dtype=np.float32)
+        if self._tail is not None:
+            out[:self._hops - 1] = self._tail
+        for j in range(self._hops):
+            out[j:j + count] += hops[:, j]
+
+        self._tail = out[count:]
+        return out[:count].reshape(-1, channels)
+
+    def _emit(self, out: np.ndarray) -> np.ndarray:
+        """
+        Drop the output the leading silence maps to, and once the input's
+        length is known, anything past `ratio` times it.
+        """
+        if self._drop > 0:
+            dropped = min(self._drop, len(out))
+            out = out[dropped:]
+            self._drop -= dropped
+        if self._total is not None:
+            out = out[:max(0, self._total - self._produced)]
+        self._produced += len(out)
+        return out
+
+    def _produce(self, channels: int) -> np.ndarray:
+        assert self._buffer is not None
+        available = self._buffer_start + len(self._buffer) - self._size
+        if available < 0:
+            return np.zeros((0, channels), dtype=np.float32)
+
+        candidates = np.arange(self._frame,
+                               int(available / self._analysis_hop) + 2)
+        positions = self._position(candidates)
+        positions = positions[positions <= available]
+
+        outputs = []
+        for pos in range(0, len(positions), _CHUNK_FRAMES):
+            frames = self._synthesize(positions[pos:pos + _CHUNK_FRAMES])
+            outputs.append(self._emit(self._overlap(frames)))
+        self._frame += len(positions)
+
+        keep = int(self._position(np.array(self._frame))) - self._buffer_start
+        self._buffer = self._buffer[keep:]
+        self._buffer_start += keep
+
+        if outputs:
+            return np.concatenate(outputs)
+        return np.zeros((0, channels), dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self._buffer is None:
+            self._buffer = np.zeros((self._lead, block.shape[1]),
+                                    dtype=np.float32)
+
+        self._buffer = np.concatenate([self._buffer, block])
+        self._consumed += len(block)
+        return self._produce(block.shape[1])
+
+    def flush(self) -> Optional[np.ndarray]:
+        if self._buffer is None:
+            return None
+
+        channels = self._buffer.shape[1]
+        self._total = round(self._consumed * self.ratio)
+        padding = np.zeros((self._size, channels), dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, padding])
+        out = [self._produce(channels)]
+        if self._tail is not None:
+            out.append(self._emit(self._tail.reshape(-1, channels)))
+            self._tail = None
+
+        short = self._total - self._produced
+        if short > 0:
+            out.append(np.zeros((short, channels), dtype=np.float32))
+            self._produced = self._total
+        return np.concatenate(out)
+
+
+class PitchShift(dsp.Stage):
+    """
+    Shifts pitch by `semitones` without changing length, by stretching and
+    then resampling by the same ratio. The ratio is rounded to a fraction
+    with a small enough denominator to keep the resampler's filter bank
+    short, which is within a hundredth of a cent. If it rounds to 1 the
+    audio passes through unchanged.
+    """
+    semitones: float
+
+    def __init__(self, semitones: float, frame_rate: int):
+        self.semitones = semitones
+        ratio = pitch_ratio(semitones)
+        self._stretch: Optional[Stretch] = None
+        self._resampler: Optional[dsp.Resampler] = None
+        if ratio != 1:
+            self._stretch = Stretch(float(ratio), frame_rate)
+            self._resampler = dsp.Resampler(ratio.numerator,
+                                            ratio.denominator)
+        self._consumed = 0
+        self._produced = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self._stretch is None or self._resampler is None:
+            return block
+
+        self._consumed += len(block)
+        out = self._resampler.process(self._stretch.process(block))
+        out = out[:max(0, self._consumed - self._produced)]
+        self._produced += len(out)
+        return out
+
+    def flush(self) -> Optional[np.ndarray]:
+        if self._stretch is None or self._resampler is None:
+            return None
+        tail = self._stretch.flush()
+        if tail is None:
+            return None
+
+        out = [self._resampler.process(tail)]
+        rest = self._resampler.flush()
+        if rest is not None:
+            out.append(rest)
+        short = self._consumed - self._produced - sum(len(o) for o in out)
+        if short > 0:
+            out.append(np.zeros((short, tail.shape[1]), dtype=np.float32))
+        return np.concatenate(out)[:self._consumed - self._produced]
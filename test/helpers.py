@@ -0,0 +1,41 @@
+"""
+Test signals, and sounds and stack frames built from them.
+
+Samples are float32 arrays of shape (frames, channels), as dsp uses.
+"""
+
+import numpy as np
+
+from mw import dsp
+from mw.stack import StackFrame
+
+
+def sine(frequency, seconds=1.0, frame_rate=48000, channels=1):
+    t = np.arange(round(seconds * frame_rate)) / frame_rate
+    samples = (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+    return np.repeat(samples[:, None], channels, axis=1)
+
+
+def noise(seed, frames, channels=1, level=0.1):
+    samples = np.random.default_rng(seed).standard_normal((frames, channels))
+    return (samples * level).astype(np.float32)
+
+
+def ramp(frames):
+    return np.linspace(-0.5, 0.5, frames, dtype=np.float32)[:, None]
+
+
+def segment(samples, frame_rate, channels=None):
+    """
+    A 16-bit sound of `samples`, with a mono signal copied to `channels`
+    channels if that's given.
+    """
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    if channels is not None:
+        samples = np.repeat(samples[:, :1], channels, axis=1)
+    return dsp.from_array(samples, frame_rate, 2)
+
+
+def stack_frame(samples, frame_rate):
+    return StackFrame(segment(samples, frame_rate))
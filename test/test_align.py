@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from helpers import noise, segment
+from mw import dsp
+from mw.align import find_lag
+from mw.stack import Stack
+
+
+RATE = 16000
+
+
+def smooth_noise(seed, frames):
+    return np.convolve(noise(seed, frames)[:, 0], np.ones(4) / 4,
+                       mode="same").astype(np.float32)
+
+
+class TestFindLag(unittest.TestCase):
+
+    def test_later_and_earlier(self):
+        source = smooth_noise(0, 160000)
+        reference = segment(source[20000:120000], RATE)
+        for shift in [1234, -5678, 0]:
+            # `other` starts `shift` frames into the reference
+            other = source[20000 + shift:100000 + shift] \
+                + smooth_noise(1, 80000) * 0.1
+            lag, confidence = find_lag(reference, segment(other, RATE,
+                                                          channels=2))
+            self.assertEqual(lag, shift)
+            self.assertGreater(confidence, 0.9)
+
+    def test_unrelated(self):
+        lag, confidence = find_lag(segment(smooth_noise(0, 32000), RATE),
+                                   segment(smooth_noise(1, 32000), RATE))
+        self.assertLess(confidence, 0.2)
+
+
+class TestStackAlign(unittest.TestCase):
+
+    def test_align_batch(self):
+        source = smooth_noise(0, 80000)
+        reference = dsp.conform(segment(source[8000:72000], RATE), 32000, 1)
+        stack = Stack([reference,
+                       segment(source[4000:60000], RATE),
+                       segment(source[12800:40000], RATE)])
+
+        results = stack.align(2)
+        self.assertEqual([round(offset, 4) for offset, _ in results],
+                         [0.3, -0.25])
+        self.assertTrue(all(confidence > 0.9 for _, confidence in results))
+
+        top = dsp.to_array(stack.entries[-1].segment)[:, 0]
+        self.assertTrue(np.allclose(top[:4800], 0.0))
+        self.assertTrue(np.allclose(top[4800:4900], source[12800:12900],
+                                    atol=1e-3))
+        middle = dsp.to_array(stack.entries[-2].segment)[:, 0]
+        self.assertTrue(np.allclose(middle[:100], source[8000:8100],
+                                    atol=1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
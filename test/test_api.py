@@ -0,0 +1,64 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+from pydub import AudioSegment
+
+from helpers import segment, sine
+from mw import dsp
+from mw.api import Editor
+from mw.types import Decibels, Milliseconds
+
+
+class TestEditor(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.editor = Editor()
+        return super().setUp()
+
+    def test_quiet(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.editor.push(segment(sine(440, frame_rate=8000), 8000))
+            self.editor.dup()
+            self.editor.gain(Decibels(-6.0))
+            self.editor.bounce()
+            self.editor.reverse(Milliseconds(0), Milliseconds(100))
+
+        self.assertEqual(out.getvalue(), "")
+        self.assertEqual(len(self.editor.stack.entries), 1)
+
+    def test_selection(self):
+        self.editor.push(segment(sine(440, frame_rate=8000), 8000))
+        self.editor.select(Milliseconds(250), Milliseconds(500))
+        self.editor.crop()
+        self.assertEqual(self.editor.length(), 250)
+
+    def test_empty(self):
+        with self.assertRaises(IndexError):
+            self.editor.gain(Decibels(1.0))
+
+    def test_pipeline_apply(self):
+        self.editor.push(segment(sine(440, frame_rate=8000), 8000))
+        self.editor.pipeline().gain(Decibels(-6.0)).invert().apply()
+        out = dsp.to_array(self.editor.top.segment)
+        self.assertAlmostEqual(float(np.max(out)), 0.5 * 10 ** (-6 / 20),
+                               places=3)
+
+        self.editor.pipeline().hpf(100).resample(16000).channels(1).apply()
+        self.assertEqual(self.editor.top.segment.frame_rate, 16000)
+        self.assertEqual(self.editor.top.segment.channels, 1)
+        self.assertEqual(self.editor.length(), 1000)
+
+    def test_pipeline_export(self):
+        self.editor.push(segment(sine(440, frame_rate=8000), 8000))
+        with tempfile.TemporaryDirectory() as d:
+            path = self.editor.pipeline().lpf(1000).resample(22050) \
+                .export(os.path.join(d, "out.wav"))
+            exported = AudioSegment.from_wav(path)
+
+        self.assertEqual(exported.frame_rate, 22050)
+        self.assertEqual(self.editor.top.segment.frame_rate, 8000)
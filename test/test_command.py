@@ -1,7 +1,9 @@
-from unittest.mock import MagicMock 
+from unittest.mock import MagicMock, patch
 from unittest import TestCase
 
-from mw import commands
+import numpy as np
+
+from mw import commands, dsp
 from mw.app import App
 from mw.display import Display
 from mw.stack import Stack
@@ -29,3 +31,136 @@ class TestCommands(TestCase):
         self.command_handler.help(self.mock_app)
 
  
+
+
+class TestMacros(TestCase):
+    def setUp(self) -> None:
+        self.app = App()
+        self.samples = np.full((8000, 1), 0.5, dtype=np.float32)
+        self.app.stack.push_sound(dsp.from_array(self.samples, 8000, 2))
+        return super().setUp()
+
+    def run_lines(self, *lines):
+        for line in lines:
+            self.app.handle_command_line(line)
+
+    def test_define_and_play(self):
+        self.run_lines("def duck a b level", "$a,$b gain $level", "end")
+        self.assertIn("duck", self.app.command_handler._available_commands())
+
+        with patch.object(Display, "print_frame_single") as redraw:
+            self.run_lines("duck 0 500 -6 2")
+        redraw.assert_called_once()
+
+        after = dsp.to_array(self.app.stack.top.segment)
+        self.assertTrue(np.allclose(after[:4000], 0.5 * 10 ** (-12 / 20),
+                                    atol=1e-3))
+        self.assertTrue(np.allclose(after[4000:], 0.5, atol=1e-3))
+
+    def test_macro_calls_macro(self):
+        self.run_lines("def quieter", "gain -3", "end",
+                       "def much-quieter", "quieter 2", "end",
+                       "much-quieter")
+        after = dsp.to_array(self.app.stack.top.segment)
+        self.assertTrue(np.allclose(after[:7900], 0.5 * 10 ** (-6 / 20),
+                                    atol=1e-3))
+
+    def test_undefined_action(self):
+        self.run_lines("def broken", "no-such-command", "end")
+        self.assertNotIn("broken",
+                         self.app.command_handler._available_commands())
+        self.assertIsNone(self.app.command_handler._recording)
+
+    def test_unknown_parameter(self):
+        self.run_lines("def broken a", "gain $b", "end")
+        self.assertNotIn("broken",
+                         self.app.command_handler._available_commands())
+
+    def test_bad_parameter_reference(self):
+        self.run_lines("def broken a", "gain $", "end")
+        self.assertNotIn("broken",
+                         self.app.command_handler._available_commands())
+
+    def test_bad_values(self):
+        self.run_lines("def duck a b level", "$a,$b gain $level", "end")
+        for line in ["duck 0 500 -6 lots", "duck 0 500 -6 0",
+                     "duck zero 500 -6"]:
+            with patch("builtins.print") as output:
+                self.run_lines(line)
+            self.assertTrue(output.call_args[0][0].startswith("Error: duck"))
+        self.assertTrue(np.array_equal(
+            dsp.to_array(self.app.stack.top.segment), self.samples))
+
+
+class TestFades(TestCase):
+    def setUp(self) -> None:
+        self.app = App()
+        self.samples = np.full((8000, 1), 0.5, dtype=np.float32)
+        self.app.stack.push_sound(dsp.from_array(self.samples, 8000, 2))
+        return super().setUp()
+
+    def test_fadein_selection(self):
+        self.app.handle_command_line("250,500 fadein")
+        after = dsp.to_array(self.app.stack.top.segment)[:, 0]
+        self.assertTrue(np.allclose(after[:2000], 0.5, atol=1e-3))
+        self.assertAlmostEqual(float(after[2000]), 0.0, places=3)
+        self.assertTrue(np.allclose(after[4000:], 0.5, atol=1e-3))
+
+    def test_fadeout_selection(self):
+        self.app.handle_command_line("250,500 fadeout")
+        after = dsp.to_array(self.app.stack.top.segment)[:, 0]
+        self.assertTrue(np.allclose(after[:2000], 0.5, atol=1e-3))
+        self.assertAlmostEqual(float(after[3999]), 0.0, places=3)
+        self.assertTrue(np.allclose(after[4000:], 0.5, atol=1e-3))
+
+    def test_fade_to_end_and_empty(self):
+        self.app.handle_command_line("500,99999 fadein")
+        after = dsp.to_array(self.app.stack.top.segment)[:, 0]
+        self.assertAlmostEqual(float(after[4000]), 0.0, places=3)
+        self.assertGreater(float(after[-1]), 0.49)
+
+        self.app.handle_command_line("500,500 fadeout")
+        self.assertTrue(np.array_equal(
+            dsp.to_array(self.app.stack.top.segment)[:, 0], after))
+
+    def test_fadein_to_in_point(self):
+        self.app.stack.top.in_point = 500
+        self.app.handle_command_line("fadein")
+        after = dsp.to_array(self.app.stack.top.segment)[:, 0]
+        self.assertAlmostEqual(float(after[0]), 0.0, places=3)
+        self.assertTrue(np.allclose(after[4000:], 0.5, atol=1e-3))
+
+
+class TestChannels(TestCase):
+    def setUp(self) -> None:
+        self.app = App()
+        samples = np.zeros((800, 2), dtype=np.float32)
+        self.app.stack.push_sound(dsp.from_array(samples, 8000, 2))
+        return super().setUp()
+
+    def test_unsupported_count(self):
+        for count in ["3", "0", "many"]:
+            with patch("builtins.print") as output:
+                self.app.handle_command_line(f"channels {count}")
+            self.assertTrue(output.call_args[0][0].startswith("Error:"))
+        self.assertEqual(self.app.stack.top.segment.channels, 2)
+
+        self.app.handle_command_line("channels 1")
+        self.assertEqual(self.app.stack.top.segment.channels, 1)
+
+
+class TestView(TestCase):
+    def setUp(self) -> None:
+        self.app = App()
+        samples = np.zeros((8000, 1), dtype=np.float32)
+        self.app.stack.push_sound(dsp.from_array(samples, 8000, 2))
+        return super().setUp()
+
+    def test_view(self):
+        top = self.app.stack.top
+        self.app.handle_command_line("250,500 view")
+        self.assertEqual((top.view_start, top.view_end), (250, 500))
+
+        top.in_point = top.out_point = None
+        self.app.handle_command_line("view")
+        self.assertEqual((top.view_start, top.view_end), (0, 1000))
@@ -101,3 +101,10 @@ class TestCommandParser(unittest.TestCase):
 
         self.assertEqual(result, {})
 
+    def test_parse_param_address(self):
+        tree = command_grammar.parse("$start,$end gain $level")
+        result = self.p.visit(tree)
+
+        self.assertEqual(result["in_addr"], "$start")
+        self.assertEqual(result["out_addr"], "$end")
+        self.assertEqual(result["arguments"], ["$level"])
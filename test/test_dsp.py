@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+
+from helpers import sine, stack_frame
+from mw import dsp
+from mw.stack import Stack
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        samples = sine(440, 0.1, 8000, channels=2)
+        for width in [1, 2, 3, 4]:
+            segment = dsp.from_array(samples, 8000, width)
+            decoded = dsp.to_array(segment)
+            self.assertEqual(decoded.shape, samples.shape)
+            self.assertLess(np.max(np.abs(decoded - samples)),
+                            2.0 / dsp.full_scale(width))
+
+    def test_blocks(self):
+        segment = dsp.from_array(sine(440, 1.0, 8000), 8000, 2)
+        blocks = list(dsp.iter_blocks(segment, 100, 7000, block_frames=1000))
+        self.assertEqual([len(b) for b in blocks], [1000] * 6 + [900])
+        self.assertTrue(np.array_equal(np.concatenate(blocks),
+                                       dsp.to_array(segment)[100:7000]))
+
+
+class TestResampler(unittest.TestCase):
+
+    def test_rates(self):
+        for in_rate, out_rate in [(44100, 48000), (48000, 8000),
+                                  (8000, 22050)]:
+            resampler = dsp.Resampler(in_rate, out_rate)
+            samples = sine(440, 0.5, in_rate)
+            out = np.concatenate(list(dsp.run([samples], [resampler])))
+
+            self.assertEqual(len(out), int(np.ceil(len(samples) * out_rate
+                                                   / in_rate)))
+            expected = sine(440, len(out) / out_rate, out_rate)
+            self.assertLess(np.max(np.abs(out[64:-64] - expected[64:-64])),
+                            1e-3)
+
+    def test_block_size_invariant(self):
+        samples = sine(1000, 0.5, 44100, channels=2)
+        whole = np.concatenate(list(dsp.run([samples],
+                                            [dsp.Resampler(44100, 48000)])))
+        blocks = (samples[i:i + 777] for i in range(0, len(samples), 777))
+        pieces = np.concatenate(list(dsp.run(blocks,
+                                             [dsp.Resampler(44100, 48000)])))
+        self.assertTrue(np.allclose(whole, pieces, atol=1e-6))
+
+
+class TestConform(unittest.TestCase):
+
+    def test_conform(self):
+        segment = dsp.from_array(sine(440, 0.25, 22050), 22050, 2)
+        out = dsp.conform(segment, 48000, 2, 4)
+        self.assertEqual(out.frame_rate, 48000)
+        self.assertEqual(out.channels, 2)
+        self.assertEqual(out.sample_width, 4)
+        self.assertIs(dsp.conform(segment, 22050, 1), segment)
+
+    def test_bounce_mixed_formats(self):
+        stack = Stack([])
+        stack.entries.append(stack_frame(sine(440, 0.5, 22050), 22050))
+        stack.entries.append(stack_frame(sine(440, 0.5, 48000, 2), 48000))
+        stack.bounce()
+
+        self.assertEqual(len(stack.entries), 1)
+        self.assertEqual(stack.top.segment.frame_rate, 48000)
+        self.assertEqual(stack.top.segment.channels, 2)
+
+    def test_conformed_cache(self):
+        frame = stack_frame(sine(440, 0.5, 22050), 22050)
+        first = frame.conformed(48000, 2, 2)
+        self.assertIs(frame.conformed(48000, 2, 2), first)
+        frame.resample(44100)
+        self.assertIsNot(frame.conformed(48000, 2, 2), first)
+
+    def test_conformed_cache_shared_by_dup(self):
+        stack = Stack([])
+        stack.entries.append(stack_frame(sine(440, 0.5, 22050), 22050))
+        stack.dup()
+        first = stack.top.conformed(48000, 2, 2)
+        self.assertIs(stack.entries[0].conformed(48000, 2, 2), first)
+
+        stack.top.resample(44100)
+        self.assertIsNot(stack.top.conformed(48000, 2, 2), first)
+        self.assertIs(stack.entries[0].conformed(48000, 2, 2), first)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from pydub import AudioSegment
+
+from helpers import sine, stack_frame
+from mw import dsp, filters
+from mw.types import Milliseconds
+
+
+def direct_form(samples, coefficients):
+    b0, b1, b2, a1, a2 = coefficients
+    out = np.zeros_like(samples)
+    s1 = np.zeros(samples.shape[1])
+    s2 = np.zeros(samples.shape[1])
+    for n in range(len(samples)):
+        y = b0 * samples[n] + s1
+        s1 = b1 * samples[n] - a1 * y + s2
+        s2 = b2 * samples[n] - a2 * y
+        out[n] = y
+    return out
+
+
+class TestFilters(unittest.TestCase):
+
+    def test_matches_direct_form(self):
+        rng = np.random.default_rng(1)
+        samples = (rng.standard_normal((5000, 2)) * 0.1).astype(np.float32)
+        designs = [filters.highpass(48000, 80, 0.707),
+                   filters.lowpass(48000, 5000, 0.707),
+                   filters.peaking(48000, 1000, 6.0, 1.0),
+                   filters.shelf(48000, 8000, -6.0, high=True)]
+
+        for coefficients in designs:
+            blocks = [samples[i:i + 999] for i in range(0, 5000, 999)]
+            out = np.concatenate(list(dsp.run(
+                blocks, [filters.Filter([coefficients])])))
+            expected = direct_form(samples.astype(np.float64), coefficients)
+            self.assertLess(np.max(np.abs(out - expected)), 1e-6)
+
+    def test_butterworth_response(self):
+        frame_rate = 48000
+        lpf = filters.lowpass_filter(frame_rate, 500, order=4)
+        stop = np.concatenate(list(dsp.run(
+            [sine(5000, frame_rate=frame_rate)], [lpf])))
+        hpf = filters.highpass_filter(frame_rate, 500, order=4)
+        passed = np.concatenate(list(dsp.run(
+            [sine(5000, frame_rate=frame_rate)], [hpf])))
+
+        # 5 kHz is over three octaves past the corner of a 24 dB/oct filter
+        self.assertLess(np.max(np.abs(stop[frame_rate // 2:])),
+                        0.5 * 10 ** (-70 / 20))
+        self.assertAlmostEqual(float(np.max(np.abs(passed[frame_rate // 2:]))),
+                               0.5, places=2)
+
+    def test_filter_selection(self):
+        frame_rate = 8000
+        frame = stack_frame(sine(100, 2.0, frame_rate), frame_rate)
+        before = dsp.to_array(frame.segment)
+        frame.process_region_stages(Milliseconds(1000), Milliseconds(2000),
+                                    [filters.highpass_filter(frame_rate,
+                                                             2000, 4)])
+        after = dsp.to_array(frame.segment)
+
+        self.assertTrue(np.array_equal(before[:8000], after[:8000]))
+        self.assertLess(np.max(np.abs(after[10000:])), 0.001)
+
+    def test_streaming_export(self):
+        frame_rate = 8000
+        frame = stack_frame(sine(100, 1.0, frame_rate), frame_rate)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "out.wav")
+            frame.export(path, [filters.lowpass_filter(frame_rate, 1000)])
+            exported = AudioSegment.from_wav(path)
+
+        self.assertEqual(exported.frame_count(), frame.segment.frame_count())
+        self.assertEqual(exported.frame_rate, frame_rate)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from mw import dsp
+from mw.markers import (Marker, MarkerIndex, load_csv, load_cue, save_csv,
+                        save_cue)
+from mw.stack import Stack, StackFrame
+from mw.types import Milliseconds
+
+
+class TestMarkerIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MarkerIndex([Marker("c", 300, 400), Marker("a", 100),
+                                  Marker("b", 200, 500)])
+
+    def test_sorted(self):
+        self.assertEqual([m.name for m in self.index], ["a", "b", "c"])
+        self.assertEqual([m.name for m in self.index.regions()], ["b", "c"])
+        self.assertEqual([m.name for m in self.index.starting_in(150, 300)],
+                         ["b"])
+
+    def test_replace_and_remove(self):
+        self.index.add(Marker("a", 600))
+        self.assertEqual([m.name for m in self.index], ["b", "c", "a"])
+        self.index.remove("b")
+        self.assertEqual([m.name for m in self.index], ["c", "a"])
+        self.assertNotIn("b", self.index)
+
+    def test_section(self):
+        section = self.index.section(250, 450)
+        self.assertEqual([(m.name, m.start, m.end) for m in section],
+                         [("b", 0, 200), ("c", 50, 150)])
+
+    def test_shift(self):
+        self.index.shift(250, -100)
+        self.assertEqual([(m.name, m.start, m.end) for m in self.index],
+                         [("a", 100, None), ("b", 200, 400), ("c", 250, 300)])
+        self.index.shift(0, 50)
+        self.assertEqual(self.index.get("a").start, 150)
+
+
+class TestMarkerFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.index = MarkerIndex([Marker("intro", 0, 48000),
+                                  Marker("hit", 76800),
+                                  Marker("verse, 1", 96000, 144000)])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_csv(self):
+        path = os.path.join(self.dir.name, "markers.csv")
+        save_csv(self.index, path, 48000)
+        loaded = load_csv(path, 48000)
+        self.assertEqual([(m.name, m.start, m.end) for m in loaded],
+                         [(m.name, m.start, m.end) for m in self.index])
+
+    def test_cue(self):
+        path = os.path.join(self.dir.name, "markers.cue")
+        save_cue(self.index, path, 48000)
+        loaded = load_cue(path, 48000, 192000)
+        self.assertEqual([(m.name, m.start, m.end) for m in loaded],
+                         [("intro", 0, 76800), ("hit", 76800, 96000),
+                          ("verse, 1", 96000, 192000)])
+
+
+class TestFrameMarkers(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.samples = (np.random.default_rng(0).standard_normal((16000, 2))
+                        * 0.1).astype(np.float32)
+        self.frame = StackFrame(dsp.from_array(self.samples, 8000, 2))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_export_regions(self):
+        for i in range(20):
+            self.frame.mark(f"cue{i}", Milliseconds(i * 100),
+                            Milliseconds(i * 100 + 50))
+        self.frame.mark("point", Milliseconds(10))
+
+        pattern = os.path.join(self.dir.name, "{index:02}_{name}.wav")
+        filenames = self.frame.export_regions(pattern, workers=4)
+        self.assertEqual(len(filenames), 20)
+
+        with wave.open(filenames[3]) as f:
+            self.assertEqual(f.getnframes(), 400)
+            data = np.frombuffer(f.readframes(400), dtype=np.int16)
+        expected = self.frame.segment.raw_data[2400 * 4:2800 * 4]
+        self.assertEqual(data.tobytes(), expected)
+
+    def test_export_duplicate_names(self):
+        self.frame.mark("take", Milliseconds(0), Milliseconds(100))
+        self.frame.mark("other", Milliseconds(200), Milliseconds(300))
+        pattern = os.path.join(self.dir.name, "same.wav")
+        with self.assertRaises(ValueError):
+            self.frame.export_regions(pattern)
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_edits_move_markers(self):
+        self.frame.mark("a", Milliseconds(500))
+        self.frame.mark("b", Milliseconds(1000), Milliseconds(1500))
+        self.frame.crop(Milliseconds(250), Milliseconds(2000))
+        self.assertEqual(self.frame.markers.get("a").start, 2000)
+        self.frame.resample(16000)
+        self.assertEqual(self.frame.markers.get("b").start, 12000)
+        self.assertEqual(self.frame.markers.get("b").end, 20000)
+
+    def test_split(self):
+        self.frame.mark("a", Milliseconds(500))
+        self.frame.mark("b", Milliseconds(800), Milliseconds(1200))
+        stack = Stack([])
+        stack.entries.append(self.frame)
+        stack.split(Milliseconds(1000))
+
+        first, second = stack.entries
+        self.assertEqual([(m.name, m.start, m.end) for m in first.markers],
+                         [("a", 4000, None), ("b", 6400, 8000)])
+        self.assertEqual([(m.name, m.start, m.end) for m in second.markers],
+                         [("b", 0, 1600)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import unittest
+
+import numpy as np
+
+from helpers import noise, segment
+from mw import dsp
+from mw.display import Display
+from mw.markers import Marker
+from mw.memory import MemoryManager, format_size, parse_size
+from mw.stack import Stack
+
+
+def sound(seed):
+    return segment(noise(seed, 48000), 48000)
+
+
+class TestSizes(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("64k"), 64 * 1024)
+        self.assertEqual(parse_size("2G"), 2 * 1024 ** 3)
+        self.assertEqual(parse_size("1.5MB"), 3 * 1024 ** 2 // 2)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+    def test_format(self):
+        self.assertEqual(format_size(100), "100B")
+        self.assertEqual(format_size(3 * 1024 ** 2 // 2), "1.5M")
+
+
+class TestMemoryManager(unittest.TestCase):
+
+    def test_spills_least_recently_used(self):
+        size = len(sound(0).raw_data)
+        stack = Stack([], memory=MemoryManager(int(size * 2.5)))
+        for i in range(3):
+            stack.push_sound(sound(i))
+
+        oldest, middle, newest = stack.entries
+        self.assertTrue(oldest.is_spilled())
+        self.assertFalse(middle.is_spilled())
+        self.assertFalse(newest.is_spilled())
+        self.assertLessEqual(stack.memory.resident(), stack.memory.budget)
+
+        # using a spilled frame reads it back and spills the next oldest
+        self.assertEqual(oldest.segment.raw_data, sound(0).raw_data)
+        self.assertFalse(oldest.is_spilled())
+        self.assertTrue(middle.is_spilled())
+        self.assertEqual(oldest.length(), 1000)
+        self.assertEqual(middle.length(), 1000)
+        self.assertEqual(middle.frame_rate(), 48000)
+        middle.markers.add(Marker("take", 24000))
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            Display().print_markers(middle)
+        self.assertIn("500.0 ms", out.getvalue())
+        self.assertTrue(middle.is_spilled())
+
+    def test_edit_spilled_frame(self):
+        size = len(sound(0).raw_data)
+        stack = Stack([], memory=MemoryManager(size))
+        stack.push_sound(sound(0))
+        stack.push_sound(sound(1))
+        first = stack.entries[0]
+        self.assertTrue(first.is_spilled())
+
+        before = dsp.to_array(sound(0))
+        first.invert(0, 500)
+        after = dsp.to_array(first.segment)
+        self.assertTrue(np.allclose(after[:24000], -before[:24000],
+                                    atol=1e-4))
+        self.assertTrue(np.array_equal(after[24000:], before[24000:]))
+        self.assertTrue(stack.entries[1].is_spilled())
+
+    def test_dup_shares_buffer(self):
+        size = len(sound(0).raw_data)
+        stack = Stack([], memory=MemoryManager(int(size * 1.5)))
+        stack.push_sound(sound(0))
+        stack.dup()
+        stack.dup()
+        # the copies share the top frame's samples, so none are spilled
+        self.assertFalse(any(frame.is_spilled() for frame in stack.entries))
+        self.assertEqual(stack.memory.resident(), size)
+
+        stack.push_sound(sound(1))
+        self.assertTrue(all(frame.is_spilled()
+                            for frame in stack.entries[:3]))
+        self.assertEqual(stack.memory.resident(), size)
+
+        # reading them back in gives one buffer again
+        first, second = stack.entries[0].segment, stack.entries[1].segment
+        self.assertIs(first, second)
+        self.assertLessEqual(stack.memory.resident(), stack.memory.budget)
+
+    def test_frame_over_budget_stays(self):
+        stack = Stack([], memory=MemoryManager(100))
+        stack.push_sound(sound(0))
+        self.assertFalse(stack.top.is_spilled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+from mw import server
+
+MEDIA = os.path.join(os.path.dirname(__file__), "media")
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "mw.sock")
+        self.server = server.Server(self.path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.dir.cleanup()
+        return super().tearDown()
+
+    def test_stdout_restored(self):
+        stdout = sys.stdout
+        other = server.Server(os.path.join(self.dir.name, "other.sock"))
+        other.server_close()
+        self.assertIs(sys.stdout, stdout)
+        self.server.server_close()
+        self.assertNotIsInstance(sys.stdout, server._ThreadOutput)
+
+    def test_socket_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_refuses_live_socket(self):
+        with self.assertRaises(OSError):
+            server.Server(self.path)
+        self.assertIn("ms", server.send(self.path, ["new 10", "length"]))
+
+        other = os.path.join(self.dir.name, "file")
+        open(other, "w").close()
+        with self.assertRaises(OSError):
+            server.Server(other)
+        self.assertTrue(os.path.exists(other))
+
+    def test_replaces_stale_socket(self):
+        stale = os.path.join(self.dir.name, "stale.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.bind(stale)
+        other = server.Server(stale)
+        other.server_close()
+        self.assertFalse(os.path.exists(stale))
+
+    def test_sessions(self):
+        tone = os.path.join(MEDIA, "tone.wav")
+        out = server.send(self.path, [f"load \"{tone}\"", "length"], "a")
+        self.assertIn("1000 ms", out)
+
+        out = server.send(self.path, ["length", "10,20 crop", "length"], "a")
+        self.assertIn("1000 ms\n", out)
+        self.assertIn("10 ms\n", out)
+
+        out = server.send(self.path, ["stack"], "b")
+        self.assertEqual(out, "Stack empty\n")
+
+    def test_shared_audio(self):
+        tone = os.path.join(MEDIA, "tone.wav")
+        server.send(self.path, [f"load \"{tone}\""], "a")
+        server.send(self.path, [f"load \"{tone}\""], "b")
+        a = self.server.session("a").app.stack.top.segment
+        b = self.server.session("b").app.stack.top.segment
+        self.assertIs(a, b)
+
+        # the cache doesn't keep audio no session holds
+        server.send(self.path, ["pop"], "a")
+        server.send(self.path, ["pop"], "b")
+        del a, b
+        self.assertEqual(len(self.server.audio_cache._files), 0)
+
+    def test_errors_and_quit(self):
+        out = server.send(self.path, ["new 100", "0,50 normalize x", "q",
+                                      "length"], "c")
+        self.assertIn("Error: 0,50 normalize x", out)
+        self.assertNotIn("ms", out)
+
+        out = server.send(self.path, ["stack"], "c")
+        self.assertEqual(out, "Stack empty\n")
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from helpers import sine, stack_frame
+from mw import spectrum
+from mw.types import Milliseconds
+
+
+class TestSpectrum(unittest.TestCase):
+
+    def test_average_spectrum(self):
+        frame = stack_frame(sine(1000.0, 4.0), 48000)
+        frequencies, levels = frame.spectrum(Milliseconds(0),
+                                             Milliseconds(1000))
+        peak = int(np.argmax(levels))
+        self.assertLess(abs(frequencies[peak] - 1000.0), 24.0)
+        # a half-scale sine is 6 dB down; the Hann window's scalloping
+        # loses at most another 1.5 dB between bins
+        self.assertLess(abs(levels[peak] + 6.0), 1.6)
+
+    def test_spectrogram_tiles_reused(self):
+        frame = stack_frame(sine(1000.0, 4.0), 48000)
+        frequencies, columns = frame.spectrogram(Milliseconds(0),
+                                                 Milliseconds(2000), 75)
+        self.assertEqual(columns.shape, (75, len(frequencies)))
+        tiles = len(frame._spectrogram)
+
+        frame.spectrogram(Milliseconds(100), Milliseconds(2100), 75)
+        self.assertLessEqual(len(frame._spectrogram), tiles + 1)
+
+    def test_edit_invalidates_overlapping_tiles(self):
+        frame = stack_frame(sine(1000.0, 20.0), 48000)
+        frame.spectrogram(Milliseconds(0), Milliseconds(20000), 75)
+        tiles = len(frame._spectrogram)
+        frame.bloop(Milliseconds(100), Milliseconds(19000))
+        self.assertEqual(len(frame._spectrogram), tiles - 1)
+
+    def test_lru(self):
+        cache = spectrum.SpectrogramCache(max_tiles=2)
+        segment = stack_frame(sine(1000.0, 4.0), 48000).segment
+        for index in range(3):
+            cache.tile(segment, spectrum.BASE_HOP, index)
+        self.assertEqual(len(cache), 2)
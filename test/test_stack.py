@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from helpers import ramp, stack_frame
+from mw import dsp
+from mw.types import Decibels, Milliseconds
+
+
+class TestRegionProcessing(unittest.TestCase):
+
+    def test_gain_region_only(self):
+        frame = stack_frame(ramp(16000), 8000)
+        before = dsp.to_array(frame.segment)
+        frame.gain(Milliseconds(500), Milliseconds(1000), Decibels(-6.0))
+        after = dsp.to_array(frame.segment)
+
+        self.assertTrue(np.array_equal(before[:4000], after[:4000]))
+        self.assertTrue(np.array_equal(before[8000:], after[8000:]))
+        self.assertTrue(np.allclose(after[4000:8000],
+                                    before[4000:8000] * 10 ** (-6 / 20),
+                                    atol=1e-4))
+
+    def test_reverse_invert(self):
+        frame = stack_frame(ramp(16000), 8000)
+        before = dsp.to_array(frame.segment)
+        frame.reverse(Milliseconds(0), Milliseconds(1000))
+        frame.invert(Milliseconds(0), Milliseconds(1000))
+        after = dsp.to_array(frame.segment)
+
+        self.assertTrue(np.allclose(after[:8000], -before[:8000][::-1],
+                                    atol=1e-4))
+        self.assertTrue(np.array_equal(before[8000:], after[8000:]))
+
+    def test_normalize(self):
+        frame = stack_frame(ramp(16000), 8000)
+        frame.normalize(Milliseconds(0), Milliseconds(1000), Decibels(3.0))
+        peak = np.max(np.abs(dsp.to_array(frame.segment)[:8000]))
+        self.assertAlmostEqual(float(peak), 10 ** (-3 / 20), places=3)
+
+    def test_peaks_kept_outside_region(self):
+        frame = stack_frame(ramp(80000), 8000)
+        frame.peaks(Milliseconds(0), Milliseconds(10000), 50)
+        cached = int(np.sum(frame._peaks._valid))
+        frame.bloop(Milliseconds(1000), Milliseconds(1000))
+
+        self.assertEqual(int(np.sum(frame._peaks._valid)), cached - 32)
+        peaks = frame.peaks(Milliseconds(0), Milliseconds(10000), 50)
+        self.assertEqual(peaks.shape, (50, 2))
+        self.assertTrue(np.all(peaks[6:9] == 0.0))
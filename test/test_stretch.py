@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from helpers import sine, stack_frame
+from mw import dsp
+from mw.stretch import PitchShift, Stretch
+from mw.types import Milliseconds
+
+
+def run(stage, samples, block_frames=dsp.BLOCK_FRAMES):
+    blocks = (samples[i:i + block_frames]
+              for i in range(0, len(samples), block_frames))
+    return np.concatenate(list(dsp.run(blocks, [stage])))
+
+
+def peak_frequency(samples, frame_rate=48000):
+    size = 1 << 15
+    start = (len(samples) - size) // 2
+    spectrum = np.abs(np.fft.rfft(samples[start:start + size, 0]
+                                  * np.hanning(size)))
+    k = int(np.argmax(spectrum))
+    a, b, c = spectrum[k - 1:k + 2]
+    return (k + 0.5 * (a - c) / (a - 2 * b + c)) * frame_rate / size
+
+
+class TestStretch(unittest.TestCase):
+
+    def test_length_and_pitch(self):
+        samples = sine(440, seconds=2.0)
+        for ratio in [0.5, 0.75, 1.5, 2.0]:
+            out = run(Stretch(ratio, 48000), samples)
+            self.assertEqual(len(out), round(len(samples) * ratio))
+            self.assertAlmostEqual(peak_frequency(out), 440, delta=0.5)
+
+            middle = out[len(out) // 5:-len(out) // 5]
+            self.assertAlmostEqual(np.sqrt(np.mean(middle ** 2)),
+                                   0.5 / np.sqrt(2), delta=0.01)
+
+    def test_unity(self):
+        samples = sine(440, channels=2)
+        out = run(Stretch(1.0, 48000), samples)
+        self.assertTrue(np.allclose(out, samples, atol=1e-4))
+
+    def test_block_size(self):
+        samples = sine(440, channels=2)
+        self.assertTrue(np.allclose(run(Stretch(1.3, 48000), samples),
+                                    run(Stretch(1.3, 48000), samples, 1000),
+                                    atol=1e-5))
+
+
+class TestPitchShift(unittest.TestCase):
+
+    def test_pitch(self):
+        samples = sine(440)
+        for semitones in [-12, -3, 7]:
+            out = run(PitchShift(semitones, 48000), samples)
+            self.assertEqual(len(out), len(samples))
+            self.assertAlmostEqual(peak_frequency(out),
+                                   440 * 2 ** (semitones / 12), delta=1.0)
+
+
+    def test_unity(self):
+        samples = sine(440, channels=2)
+        self.assertTrue(np.array_equal(run(PitchShift(0, 48000), samples),
+                                       samples))
+
+
+class TestStretchRegion(unittest.TestCase):
+
+    def test_stretch_selection(self):
+        frame = stack_frame(sine(440), 48000)
+        before = dsp.to_array(frame.segment)
+        frame.in_point = Milliseconds(200)
+        frame.out_point = Milliseconds(400)
+        frame.stretch(Milliseconds(200), Milliseconds(400), 2.0)
+
+        after = dsp.to_array(frame.segment)
+        self.assertEqual(len(frame.segment), 1200)
+        self.assertEqual(frame.out_point, 600)
+        self.assertTrue(np.array_equal(after[:9600], before[:9600]))
+        self.assertTrue(np.array_equal(after[-28800:], before[-28800:]))
+
+
+if __name__ == '__main__':
+    unittest.main()